@@ -1,11 +1,15 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
 from datetime import datetime, timedelta
-import time
 import os
-from assistant import GeminiHealthChatbot
+import html
+import atexit
+import bisect
+import tempfile
+from functools import partial
+from schedule import make_rule, count_unique_doses, expand_rules
+from schedule_store import ScheduleStore, ScheduleDispatcher
 
 # ============= PAGE CONFIG =============
 st.set_page_config(
@@ -25,19 +29,60 @@ load_css("style.css")
 BROKER = st.secrets.get("MQTT_BROKER", "broker.emqx.io")
 PORT = int(st.secrets.get("MQTT_PORT", 1883))
 MODEL_PATH = "models/smarthealth_retrained.pkl"
-CSV_PATH = "data.csv"
+CSV_PATH = st.secrets.get("CSV_PATH", "data.csv")
+SCHEDULE_DB_PATH = st.secrets.get("SCHEDULE_DB_PATH", "schedules.db")
+LIVE_REFRESH_SECONDS = 0.5
+ARCHIVE_DIR = st.secrets.get("ARCHIVE_DIR", "archive")
+# rollup + hapus segmen raw lebih tua dari N hari; tidak diisi = data raw tidak pernah dihapus
+RETENTION_RAW_DAYS = st.secrets.get("RETENTION_RAW_DAYS")
+# snapshot state per device untuk warm restart; secret STATE_SNAPSHOT_PATH = "" mematikannya
+STATE_SNAPSHOT_PATH = st.secrets.get("STATE_SNAPSHOT_PATH", os.path.join("cache", "device_state.npz")) or None
+STATE_SNAPSHOT_SECONDS = 60
 
 from mqtt_client import MQTTRunner
-if "mqtt_runner" not in st.session_state:
+from retention import SensorLogRetention, RetentionMaintainer
+from model_reload import ModelReloader, DEFAULT_MIN_AGREEMENT
+from state_snapshot import StateSnapshotter
+
+@st.cache_resource(show_spinner=False)
+def start_mqtt_services(broker, port, csv_path, state_path, archive_dir, raw_days):
+    # satu runner per proses (per konfigurasi), dipakai bersama semua sesi browser
     runner = MQTTRunner(
-        broker=BROKER,
-        port=PORT,
+        broker=broker,
+        port=port,
         model_path=MODEL_PATH,
-        csv_path=CSV_PATH
+        csv_path=csv_path,
+        retention=SensorLogRetention(
+            csv_path, archive_dir=archive_dir, raw_days=int(raw_days) if raw_days else 30
+        ),
+        state_path=state_path
     )
     runner.start()
-    st.session_state.mqtt_runner = runner
 
+    # rotasi & kompresi di thread pemeliharaan, bukan di thread pesan MQTT;
+    # rollup (menghapus raw) hanya jika RETENTION_RAW_DAYS diisi
+    RetentionMaintainer(runner.retention, writer_lock=runner.lock, policy=bool(raw_days)).start()
+
+    # snapshot state per device berkala (warm restart), juga saat proses berhenti normal
+    if state_path:
+        snapshotter = StateSnapshotter(runner, state_path, interval=STATE_SNAPSHOT_SECONDS)
+        snapshotter.start()
+        atexit.register(snapshotter.stop)
+
+    # pkl baru di MODEL_PATH dimuat & di-swap otomatis (MODEL_SHADOW: nilai paralel dulu);
+    # ditolak jika kelasnya terlalu jarang sama dengan model aktif (MODEL_MIN_AGREEMENT)
+    reloader = ModelReloader(
+        runner, MODEL_PATH,
+        shadow=bool(st.secrets.get("MODEL_SHADOW", False)),
+        min_agreement=float(st.secrets.get("MODEL_MIN_AGREEMENT", DEFAULT_MIN_AGREEMENT)),
+    )
+    reloader.start()
+    return runner
+
+if "mqtt_runner" not in st.session_state:
+    st.session_state.mqtt_runner = start_mqtt_services(
+        BROKER, PORT, CSV_PATH, STATE_SNAPSHOT_PATH, ARCHIVE_DIR, RETENTION_RAW_DAYS
+    )
 
 if "mqtt_runner" not in st.session_state:
     from mqtt_client import MQTTRunner
@@ -50,66 +95,169 @@ if not os.path.exists(MODEL_PATH):
 else:
     MODEL_AVAILABLE = True
 
-df = pd.read_csv("data.csv")
-
 if not os.path.exists(CSV_PATH):
     pd.DataFrame(columns=["ts", "device", "temp", "hum", "gas", "ai", "heartrate"]).to_csv(CSV_PATH, index=False)
 
-if "medicine_schedules" not in st.session_state:
-    st.session_state.medicine_schedules = []
+@st.cache_resource(show_spinner=False)
+def start_schedule_services(_runner, db_path):
+    # satu store + dispatcher per proses: tiap dosis dipublish sekali walau banyak sesi terbuka
+    store = ScheduleStore(db_path)
+    dispatcher = ScheduleDispatcher(store, publish=_runner.publish_obat_due)
+    dispatcher.start()
+    return store, dispatcher
+
+if "schedule_store" not in st.session_state:
+    store, dispatcher = start_schedule_services(st.session_state.mqtt_runner, SCHEDULE_DB_PATH)
+    st.session_state.schedule_store = store
+    st.session_state.schedule_dispatcher = dispatcher
+
+def add_medicine_rule(label, medicine_name, start_date, end_date, times):
+    if not (medicine_name.strip() and start_date and end_date and times):
+        st.error("Isi semua field!")
+        return
+    if start_date > end_date:
+        st.error("Tanggal mulai harus <= tanggal selesai!")
+        return
+
+    rule = make_rule(medicine_name, start_date, end_date, times)
+    rule_id, new_doses = st.session_state.schedule_store.add(rule)
+    if rule_id is None:
+        st.warning("Semua jadwal sudah ada dalam daftar.")
+        return
+
+    # pengingat ke device dikirim dispatcher saat jatuh tempo (SHHE/obat);
+    # rule hanya disalin ke SHHE/obat/rules sebagai informasi
+    st.session_state.schedule_dispatcher.add(rule_id, rule)
+    if "mqtt_runner" in st.session_state:
+        st.session_state.mqtt_runner.publish_obat_rules([rule])
+    st.success(f"{label} ditambahkan: {new_doses} jadwal baru!")
 
 # ============= LOAD DATA =============
-expected_cols = ["ts", "device", "temp", "hum", "gas", "ai", "heartrate"]
-
-def _safe_read_csv(path):
-    try:
-        df = pd.read_csv(path)
-        if not set(expected_cols).issubset(df.columns):
-            df2 = pd.read_csv(path, header=None)
-            if df2.shape[1] >= len(expected_cols):
-                df2 = df2.iloc[:, :len(expected_cols)]
-                df2.columns = expected_cols
-                return df2
-            return pd.DataFrame(columns=expected_cols)
-        return df
-    except Exception as e:
-        print("Warning reading CSV:", e)
-        return pd.DataFrame(columns=expected_cols)
-
-df = _safe_read_csv(CSV_PATH)
-for col in ("temp", "hum", "gas", "heartrate"):
-    if col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-    else:
-        df[col] = 0
-
-if "ts" in df.columns:
-    try:
-        df["ts"] = pd.to_datetime(df["ts"], errors="coerce")
-    except:
-        df["ts"] = df["ts"].astype(str)
-
-last_record = st.session_state.mqtt_runner.get_latest_record() if "mqtt_runner" in st.session_state else {}
-
-if not last_record and not df.empty:
-    last_row = df.iloc[-1].to_dict()
-    last_record = {
-        "ts": last_row.get("ts", ""),
-        "device": last_row.get("device", ""),
-        "temp": float(last_row.get("temp") or 0),
-        "hum": float(last_row.get("hum") or 0),
-        "gas": float(last_row.get("gas") or 0),
-        "heartrate": float(last_row.get("heartrate") or 0) if last_row.get("heartrate") else 0,
-        "ai": last_row.get("ai", "N/A")
+@st.cache_resource(show_spinner=False)
+def load_sensor_history(csv_path, archive_dir):
+    from history import SensorHistory
+    return SensorHistory(csv_path, archive_dir)
+
+def get_sensor_history():
+    # index waktu per device (history.py), satu per proses: sumber overview, gauge, grafik,
+    # asisten & endpoint HTTP opsional; refresh hanya membaca baris baru data.csv
+    history = load_sensor_history(CSV_PATH, ARCHIVE_DIR)
+    history.refresh()
+    return history
+
+def history_summary(device, window="1h"):
+    from history import SEVERITY
+    end = pd.Timestamp.now()
+    ts, cols = get_sensor_history().query(device, end - pd.Timedelta(window), end, ["temp", "hum", "gas", "ai"])
+    if len(ts) == 0:
+        return None
+    worst = int(cols["ai"].max())
+    return {
+        "window": window,
+        "samples": len(ts),
+        "temp": float(np.nanmean(cols["temp"])),
+        "hum": float(np.nanmean(cols["hum"])),
+        "gas": float(np.nanmean(cols["gas"])),
+        "worst_ai": SEVERITY[worst] if worst >= 0 else "N/A",
     }
 
-temp = float(last_record.get("temp", 0) or 0)
-hum = float(last_record.get("hum", 0) or 0)
-gas = float(last_record.get("gas", 0) or 0)
-hr_raw = last_record.get("heartrate")
-# hanya pakai heartrate jika >1, selain itu set 0
-heartrate = float(hr_raw) if hr_raw and float(hr_raw) > 1 else 0
-ai_status = last_record.get("ai", "N/A")
+@st.cache_resource(show_spinner=False)
+def start_history_server(port):
+    # sekali per proses; port yang sudah dipakai proses lain tidak menghentikan dashboard
+    from history import serve
+    try:
+        return serve(get_sensor_history(), port=port)
+    except OSError as e:
+        print(f"[HISTORY] Cannot serve on port {port}:", e)
+        return None
+
+HISTORY_API_PORT = st.secrets.get("HISTORY_API_PORT")
+if HISTORY_API_PORT:
+    start_history_server(int(HISTORY_API_PORT))
+
+SEVERITY_ORDER = {"DANGER": 0, "ALERT": 1, "GOOD": 2}
+DEVICES_PER_PAGE = 12
+
+def _overview_key(name, record):
+    return (SEVERITY_ORDER.get(str(record.get("ai")).upper(), 3), name)
+
+def get_device_overview(version):
+    # record terakhir tiap device (index history + perubahan dari runner), terparah dulu.
+    # Inkremental: hanya device yang berubah sejak version terakhir dipindah di urutan
+    # (bisect), tanpa sort ulang atau membangun ulang last_records() tiap version.
+    overview = st.session_state.get("device_overview")
+    if overview is None:
+        by_device = get_sensor_history().last_records()
+        overview = {
+            "version": 0,
+            "by_device": by_device,
+            "order": sorted(_overview_key(name, rec) for name, rec in by_device.items()),
+            "names": sorted(by_device),
+        }
+        st.session_state.device_overview = overview
+    if overview["version"] == version:
+        return overview
+
+    overview["version"], changes = st.session_state.mqtt_runner.get_device_changes(overview["version"])
+    by_device, order, names = overview["by_device"], overview["order"], overview["names"]
+    for name, record in changes.items():
+        name = str(name)
+        old = by_device.get(name)
+        if old is None:
+            bisect.insort(names, name)
+        else:
+            del order[bisect.bisect_left(order, _overview_key(name, old))]
+        bisect.insort(order, _overview_key(name, record))
+        by_device[name] = record
+    return overview
+
+EXPORT_FORMATS = {"CSV (gzip)": ".csv.gz", "Parquet": ".parquet"}
+# hasil export (terkompresi) dimuat penuh ke memori untuk dikirim ke browser,
+# jadi rentang di dashboard dibatasi; export lebih besar lewat CLI export.py
+EXPORT_MAX_DAYS = 31
+
+def export_download(devices, start, end, kind, fmt):
+    # ditulis per chunk ke file sementara (memori konstan), lalu file hasilnya dibaca untuk download
+    from export import export_history
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "export" + EXPORT_FORMATS[fmt])
+        result = export_history(path, CSV_PATH, ARCHIVE_DIR, devices, start, end, kind)
+        print("[EXPORT]", result)
+        with open(path, "rb") as f:
+            return f.read()
+
+GAUGE_COLUMNS = ("temp", "hum", "gas", "heartrate")
+GAUGE_WINDOW = pd.Timedelta(hours=24)
+
+def get_gauge_stats(version, device):
+    # min/max/avg GAUGE_WINDOW terakhir device dari index history (termasuk arsip),
+    # dihitung ulang hanya jika data version atau device berubah
+    cache = st.session_state.get("gauge_stats")
+    if cache is None or cache["key"] != (version, device):
+        stats = {col: (0, 0, 0) for col in GAUGE_COLUMNS}
+        history = get_sensor_history()
+        last_ts, _ = history.query(device, columns=[], limit=1)
+        if len(last_ts):
+            _, cols = history.query(device, int(last_ts[-1]) - GAUGE_WINDOW.value, None, list(GAUGE_COLUMNS))
+            for col, values in cols.items():
+                if np.isfinite(values).any():
+                    stats[col] = (np.nanmin(values), np.nanmax(values), np.nanmean(values))
+        cache = {"key": (version, device), "stats": stats}
+        st.session_state.gauge_stats = cache
+    return cache["stats"]
+
+def render_device_grid(overview):
+    order, by_device = overview["order"], overview["by_device"]
+    n_pages = max(1, -(-len(order) // DEVICES_PER_PAGE))
+    page = st.number_input("Halaman", min_value=1, max_value=n_pages, value=1, key="device_page") if n_pages > 1 else 1
+    visible = [by_device[name] for _, name in order[(page - 1) * DEVICES_PER_PAGE:page * DEVICES_PER_PAGE]]
+    grid = st.columns(4)
+    for i, rec in enumerate(visible):
+        # nama device & label berasal dari payload broker publik: escape sebelum masuk HTML
+        device_name = html.escape(str(rec.get('device')))
+        ai_label = html.escape(str(rec.get('ai', 'N/A')))
+        with grid[i % 4]:
+            st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>{device_name}</div><div class='metric-value-modern' style='font-size: 0.9rem;'><span class='status-badge'>{ai_label}</span> {float(rec.get('temp') or 0):.1f}°C · {float(rec.get('gas') or 0):.0f} · {float(rec.get('heartrate') or 0):.0f} BPM</div></div>", unsafe_allow_html=True)
 
 # ============= HEADER =============
 st.markdown("<h1 class='dashboard-title'>🌡️ Smart Health Ecosystem</h1>", unsafe_allow_html=True)
@@ -125,167 +273,201 @@ with tab_monitoring:
     if "auto_refresh" not in st.session_state:
         st.session_state.auto_refresh = False
     
-    col1, col2, col3, col4, col5, col6 = st.columns(6)
-    with col1:
-        st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Temperature</div><div class='metric-value-modern'>{temp:.1f}°C</div></div>", unsafe_allow_html=True)
-    with col2:
-        st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Humidity</div><div class='metric-value-modern'>{hum:.1f}%</div></div>", unsafe_allow_html=True)
-    with col3:
-        st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Gas Level</div><div class='metric-value-modern'>{gas:.0f}</div></div>", unsafe_allow_html=True)
-    with col4:
-        st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Heart Rate</div><div class='metric-value-modern'>{heartrate:.0f}</div></div>", unsafe_allow_html=True)
-    with col5:
-        status_class = "status-normal" if ai_status == "Normal" else "status-alert" if ai_status == "Warning" else "status-danger"
-        st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>AI Status</div><div class='metric-value-modern' style='font-size: 0.5rem;'><span class='status-badge'>{ai_status}</span></div></div>", unsafe_allow_html=True)
-    with col6:
-        if st.button("AUTO REFRESH", use_container_width=True, key="toggle_auto_refresh"):
-            st.session_state.auto_refresh = not st.session_state.auto_refresh
+    @st.fragment
+    def live_monitoring():
+        # Fragment berat (grid, gauge, grafik) tanpa run_every: hanya dirender ulang saat
+        # poll_data_version melihat data version baru atau saat widget di dalamnya dipakai.
+        data_version = st.session_state.mqtt_runner.get_data_version()
+        st.session_state.rendered_data_version = data_version
+        overview = get_device_overview(data_version)
+        records = overview["by_device"]
+        if len(records) > 1:
+            st.markdown("<div class='section-header'>Ringkasan Perangkat</div>", unsafe_allow_html=True)
+            render_device_grid(overview)
+        device_names = overview["names"]
+        selected_device = st.selectbox("Perangkat", device_names, key="selected_device") if device_names else None
+
+        # detail (gauge, grafik) hanya untuk device yang dipilih
+        last_record = records.get(selected_device) or {}
+        temp = float(last_record.get("temp", 0) or 0)
+        hum = float(last_record.get("hum", 0) or 0)
+        gas = float(last_record.get("gas", 0) or 0)
+        hr_raw = last_record.get("heartrate")
+        # hanya pakai heartrate jika >1, selain itu set 0
+        heartrate = float(hr_raw) if hr_raw and float(hr_raw) > 1 else 0
+        ai_status = last_record.get("ai", "N/A")
+        gauge_stats = get_gauge_stats(data_version, selected_device)
+
+        col1, col2, col3, col4, col5, col6 = st.columns(6)
+        with col1:
+            st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Temperature</div><div class='metric-value-modern'>{temp:.1f}°C</div></div>", unsafe_allow_html=True)
+        with col2:
+            st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Humidity</div><div class='metric-value-modern'>{hum:.1f}%</div></div>", unsafe_allow_html=True)
+        with col3:
+            st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Gas Level</div><div class='metric-value-modern'>{gas:.0f}</div></div>", unsafe_allow_html=True)
+        with col4:
+            st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>Heart Rate</div><div class='metric-value-modern'>{heartrate:.0f}</div></div>", unsafe_allow_html=True)
+        with col5:
+            status_class = "status-normal" if ai_status == "Normal" else "status-alert" if ai_status == "Warning" else "status-danger"
+            st.markdown(f"<div class='metric-card-modern'><div class='metric-label-modern'>AI Status</div><div class='metric-value-modern' style='font-size: 0.5rem;'><span class='status-badge'>{html.escape(str(ai_status))}</span></div></div>", unsafe_allow_html=True)
+        with col6:
+            if st.button("AUTO REFRESH", use_container_width=True, key="toggle_auto_refresh"):
+                st.session_state.auto_refresh = not st.session_state.auto_refresh
+                st.rerun()
+
+        shadow_stats = st.session_state.mqtt_runner.get_shadow_stats()
+        if shadow_stats["active"]:
+            col_shadow, col_promote = st.columns([5, 1])
+            with col_shadow:
+                st.caption(f"Shadow model: {shadow_stats['total']} prediksi, {shadow_stats['disagree_rate']:.1%} berbeda {shadow_stats['pairs']}")
+            with col_promote:
+                # model shadow menggantikan model aktif (state per device ikut dipindah)
+                if st.button("Promote", key="promote_shadow", use_container_width=True):
+                    st.session_state.mqtt_runner.promote_shadow()
+                    st.rerun()
     
-    # ============= SENSOR VISUALIZATION =============
-    st.markdown("<div class='section-header'>Visualisasi Data Sensor</div>", unsafe_allow_html=True)
-    st.markdown("<div class='gauge-viz-container'>", unsafe_allow_html=True)
+        # ============= SENSOR VISUALIZATION =============
+        st.markdown("<div class='section-header'>Visualisasi Data Sensor</div>", unsafe_allow_html=True)
+        st.markdown("<div class='gauge-viz-container'>", unsafe_allow_html=True)
     
-    col_gauge1, col_gauge2, col_gauge3, col_gauge4 = st.columns(4)
-    with col_gauge1:
-        temp_percent = min(100, max(0, (temp / 50) * 100))
-        st.markdown(f"""
-        <div class='gauge-circular-container'>
-            <div class='gauge-circular-label'>Temperature</div>
-            <div class='gauge-circular-wrapper'>
-                <div class='gauge-circular-bg'></div>
-                <div class='gauge-circular-fill' style='--gauge-percent: {temp_percent}%'></div>
-                <div class='gauge-circular-text'>
-                    <div class='gauge-circular-value'>{temp:.1f}</div>
-                    <div class='gauge-circular-unit'>°C</div>
+        col_gauge1, col_gauge2, col_gauge3, col_gauge4 = st.columns(4)
+        with col_gauge1:
+            temp_percent = min(100, max(0, (temp / 50) * 100))
+            st.markdown(f"""
+            <div class='gauge-circular-container'>
+                <div class='gauge-circular-label'>Temperature</div>
+                <div class='gauge-circular-wrapper'>
+                    <div class='gauge-circular-bg'></div>
+                    <div class='gauge-circular-fill' style='--gauge-percent: {temp_percent}%'></div>
+                    <div class='gauge-circular-text'>
+                        <div class='gauge-circular-value'>{temp:.1f}</div>
+                        <div class='gauge-circular-unit'>°C</div>
+                    </div>
+                </div>
+                <div class='gauge-stats-modern'>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{gauge_stats['temp'][0]:.1f}°C</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{gauge_stats['temp'][1]:.1f}°C</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{gauge_stats['temp'][2]:.1f}°C</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Optimal</div></div>
                 </div>
             </div>
-            <div class='gauge-stats-modern'>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{df['temp'].min() if not df.empty else 0:.1f}°C</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{df['temp'].max() if not df.empty else 0:.1f}°C</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{df['temp'].mean() if not df.empty else 0:.1f}°C</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Optimal</div></div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
     
-    with col_gauge2:
-        hum_percent = min(100, max(0, hum))
-        st.markdown(f"""
-        <div class='gauge-circular-container'>
-            <div class='gauge-circular-label'>Humidity</div>
-            <div class='gauge-circular-wrapper'>
-                <div class='gauge-circular-bg'></div>
-                <div class='gauge-circular-fill' style='--gauge-percent: {hum_percent}%'></div>
-                <div class='gauge-circular-text'>
-                    <div class='gauge-circular-value'>{hum:.1f}</div>
-                    <div class='gauge-circular-unit'>%</div>
+        with col_gauge2:
+            hum_percent = min(100, max(0, hum))
+            st.markdown(f"""
+            <div class='gauge-circular-container'>
+                <div class='gauge-circular-label'>Humidity</div>
+                <div class='gauge-circular-wrapper'>
+                    <div class='gauge-circular-bg'></div>
+                    <div class='gauge-circular-fill' style='--gauge-percent: {hum_percent}%'></div>
+                    <div class='gauge-circular-text'>
+                        <div class='gauge-circular-value'>{hum:.1f}</div>
+                        <div class='gauge-circular-unit'>%</div>
+                    </div>
+                </div>
+                <div class='gauge-stats-modern'>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{gauge_stats['hum'][0]:.1f}%</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{gauge_stats['hum'][1]:.1f}%</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{gauge_stats['hum'][2]:.1f}%</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Good</div></div>
                 </div>
             </div>
-            <div class='gauge-stats-modern'>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{df['hum'].min() if not df.empty else 0:.1f}%</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{df['hum'].max() if not df.empty else 0:.1f}%</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{df['hum'].mean() if not df.empty else 0:.1f}%</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Good</div></div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
     
-    with col_gauge3:
-        gas_percent = min(100, max(0, (gas / 1000) * 100))
-        st.markdown(f"""
-        <div class='gauge-circular-container'>
-            <div class='gauge-circular-label'>Gas Level</div>
-            <div class='gauge-circular-wrapper'>
-                <div class='gauge-circular-bg'></div>
-                <div class='gauge-circular-fill' style='--gauge-percent: {gas_percent}%'></div>
-                <div class='gauge-circular-text'>
-                    <div class='gauge-circular-value'>{gas:.0f}</div>
-                    <div class='gauge-circular-unit'>ppm</div>
+        with col_gauge3:
+            gas_percent = min(100, max(0, (gas / 1000) * 100))
+            st.markdown(f"""
+            <div class='gauge-circular-container'>
+                <div class='gauge-circular-label'>Gas Level</div>
+                <div class='gauge-circular-wrapper'>
+                    <div class='gauge-circular-bg'></div>
+                    <div class='gauge-circular-fill' style='--gauge-percent: {gas_percent}%'></div>
+                    <div class='gauge-circular-text'>
+                        <div class='gauge-circular-value'>{gas:.0f}</div>
+                        <div class='gauge-circular-unit'>ppm</div>
+                    </div>
+                </div>
+                <div class='gauge-stats-modern'>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{gauge_stats['gas'][0]:.0f}</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{gauge_stats['gas'][1]:.0f}</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{gauge_stats['gas'][2]:.0f}</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Safe</div></div>
                 </div>
             </div>
-            <div class='gauge-stats-modern'>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{df['gas'].min() if not df.empty else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{df['gas'].max() if not df.empty else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{df['gas'].mean() if not df.empty else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>Safe</div></div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
     
-    with col_gauge4:
-        if heartrate > 0:
-            hr_percent = min(100, max(0, (heartrate / 200) * 100))
-            hr_display_status = "Normal" if 60 <= heartrate <= 100 else "Elevated" if heartrate > 100 else "Low"
-        else:
-            hr_percent = 0
-            hr_display_status = "N/A"
-        st.markdown(f"""
-        <div class='gauge-circular-container'>
-            <div class='gauge-circular-label'>Heart Rate</div>
-            <div class='gauge-circular-wrapper'>
-                <div class='gauge-circular-bg'></div>
-                <div class='gauge-circular-fill' style='--gauge-percent: {hr_percent}%'></div>
-                <div class='gauge-circular-text'>
-                    <div class='gauge-circular-value'>{heartrate:.0f}</div>
-                    <div class='gauge-circular-unit'>BPM</div>
+        with col_gauge4:
+            if heartrate > 0:
+                hr_percent = min(100, max(0, (heartrate / 200) * 100))
+                hr_display_status = "Normal" if 60 <= heartrate <= 100 else "Elevated" if heartrate > 100 else "Low"
+            else:
+                hr_percent = 0
+                hr_display_status = "N/A"
+            st.markdown(f"""
+            <div class='gauge-circular-container'>
+                <div class='gauge-circular-label'>Heart Rate</div>
+                <div class='gauge-circular-wrapper'>
+                    <div class='gauge-circular-bg'></div>
+                    <div class='gauge-circular-fill' style='--gauge-percent: {hr_percent}%'></div>
+                    <div class='gauge-circular-text'>
+                        <div class='gauge-circular-value'>{heartrate:.0f}</div>
+                        <div class='gauge-circular-unit'>BPM</div>
+                    </div>
+                </div>
+                <div class='gauge-stats-modern'>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{gauge_stats['heartrate'][0]:.0f}</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{gauge_stats['heartrate'][1]:.0f}</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{gauge_stats['heartrate'][2]:.0f}</div></div>
+                    <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>{hr_display_status}</div></div>
                 </div>
             </div>
-            <div class='gauge-stats-modern'>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Min</div><div class='gauge-stat-value-modern'>{df['heartrate'].min() if not df.empty and 'heartrate' in df.columns else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Max</div><div class='gauge-stat-value-modern'>{df['heartrate'].max() if not df.empty and 'heartrate' in df.columns else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Avg</div><div class='gauge-stat-value-modern'>{df['heartrate'].mean() if not df.empty and 'heartrate' in df.columns else 0:.0f}</div></div>
-                <div class='gauge-stat-modern'><div class='gauge-stat-label-modern'>Status</div><div class='gauge-stat-value-modern'>{hr_display_status}</div></div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
     
-    st.markdown("</div>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
     
-    # ============= TREND CHART =============
-    st.markdown("<div class='section-header'>Tren Grafik Data Lingkungan</div>", unsafe_allow_html=True)
-    st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
-    if not df.empty:
-        recent = df.tail(200).copy()
-        fig_trend = go.Figure()
-        fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['temp'], name='Temperature', line=dict(color='#ff6b6b', width=3), mode='lines', fill='tonexty', fillcolor='rgba(255, 107, 107, 0.1)', yaxis='y1'))
-        fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['hum'], name='Humidity', line=dict(color='#1db8a0', width=3), mode='lines', fill='tonexty', fillcolor='rgba(29, 184, 160, 0.1)', yaxis='y2'))
-        fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['gas']/10, name='Gas (÷10)', line=dict(color='#2dd9ce', width=3), mode='lines', fill='tonexty', fillcolor='rgba(45, 217, 206, 0.1)', yaxis='y3'))
-        if 'heartrate' in recent.columns:
-            fig_trend.add_trace(go.Scatter(x=recent['ts'], y=recent['heartrate'], name='Heart Rate', line=dict(color='#f44336', width=3), mode='lines+markers', yaxis='y4'))
-        fig_trend.update_layout(
-            hovermode='x unified', 
-            plot_bgcolor='rgba(15, 31, 30, 0.5)', 
-            paper_bgcolor='rgba(0,0,0,0)', 
-            xaxis=dict(
-                showgrid=True, 
-                gridcolor='rgba(29, 184, 160, 0.15)', 
-                color='#2dd9ce',
-                tickformat='%Y-%m-%d %H:%M:%S'
-            ), 
-            height=320, 
-            margin=dict(l=60, r=30, t=30, b=60),
-            font={'family': 'Poppins', 'color': '#2dd9ce', 'size': 11},
-            legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="right", x=1, bgcolor='rgba(25, 35, 33, 0.9)', bordercolor='rgba(29, 184, 160, 0.25)', borderwidth=2),
-            yaxis=dict(showgrid=True, gridcolor='rgba(29, 184, 160, 0.15)', color='#2dd9ce', title='Temp/Humidity/Gas'),
-            yaxis2=dict(showgrid=False, color='#2dd9ce', overlaying='y', side='right'),
-            yaxis3=dict(showgrid=False, color='#2dd9ce', overlaying='y', side='right'),
-            yaxis4=dict(showgrid=False, color='#f44336', overlaying='y', side='right')
-        )
-        st.plotly_chart(fig_trend, use_container_width=True, config={'displayModeBar': True})
-    else:
-        st.info("Menunggu data sensor...")
-    st.markdown("</div>", unsafe_allow_html=True)
+        # ============= TREND CHART =============
+        st.markdown("<div class='section-header'>Tren Grafik Data Lingkungan</div>", unsafe_allow_html=True)
+        st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
+        if selected_device is not None:
+            # plotly baru diimport saat grafik pertama kali dirender
+            from charts import TrendFigureCache, TIME_RANGES, RESOLUTIONS, query_window
+            col_range, col_res = st.columns(2)
+            with col_range:
+                time_range = st.selectbox("Rentang", list(TIME_RANGES), key="trend_range")
+            with col_res:
+                resolution = st.selectbox("Resolusi", list(RESOLUTIONS), key="trend_resolution")
+            if st.session_state.get("trend_cache_device") != selected_device:
+                st.session_state.trend_cache = TrendFigureCache()
+                st.session_state.trend_cache_device = selected_device
+            # rentang dibaca dari index history (arsip + data.csv) hanya jika data version berubah
+            trend_cache = st.session_state.trend_cache
+            fig_trend = trend_cache.cached(data_version, time_range, resolution)
+            if fig_trend is None:
+                window = query_window(get_sensor_history(), selected_device, time_range, resolution)
+                fig_trend = trend_cache.get(window, data_version, time_range, resolution)
+            st.plotly_chart(fig_trend, use_container_width=True, config={'displayModeBar': True})
+        else:
+            st.info("Menunggu data sensor...")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    @st.fragment(run_every=LIVE_REFRESH_SECONDS)
+    def poll_data_version():
+        # polling ringan tiap LIVE_REFRESH_SECONDS (tanpa elemen); rerun hanya jika ada data baru
+        if st.session_state.mqtt_runner.get_data_version() != st.session_state.get("rendered_data_version"):
+            st.rerun()
+
+    live_monitoring()
+    if st.session_state.auto_refresh:
+        poll_data_version()
     
     # ============= HEALTH ASSISTANT =============
     st.markdown("<div class='section-header'>Asisten Kesehatan</div>", unsafe_allow_html=True)
 
-    if "health_chatbot" not in st.session_state:
-        with st.spinner("Menghubungkan ke Asisten Kesehatan Gemini"):
-            st.session_state.health_chatbot = GeminiHealthChatbot(model_name="gemini-2.5-flash")
+    # google.generativeai baru diimport saat asisten pertama kali dipakai
+    chatbot = st.session_state.get("health_chatbot")
 
-    chatbot = st.session_state.health_chatbot
-
-    if not getattr(chatbot, "ready", False):
+    if chatbot is not None and not getattr(chatbot, "ready", False):
         st.warning("Asisten belum siap. Pastikan GOOGLE_API_KEY ada di .streamlit/secrets.toml")
     else:
         st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
@@ -298,9 +480,25 @@ with tab_monitoring:
         )
 
         if st.button("Kirim ke Asisten Kesehatan", type="primary", use_container_width=True):
-            if user_input.strip():
+            if user_input.strip() and chatbot is None:
+                with st.spinner("Menghubungkan ke Asisten Kesehatan Gemini"):
+                    from assistant import GeminiHealthChatbot
+                    chatbot = GeminiHealthChatbot(model_name="gemini-2.5-flash")
+                    st.session_state.health_chatbot = chatbot
+                if not chatbot.ready:
+                    st.warning("Asisten belum siap. Pastikan GOOGLE_API_KEY ada di .streamlit/secrets.toml")
+            if user_input.strip() and chatbot.ready:
                 with st.spinner("Asisten sedang menganalisis data sensor dan pertanyaan Anda..."):
-                    reply = chatbot.ask(user_input, sensor_context=last_record)
+                    # record terakhir baru diambil saat bertanya; index history jika runner belum punya data
+                    selected_device = st.session_state.get("selected_device")
+                    last_record = st.session_state.mqtt_runner.get_latest_record(selected_device)
+                    if not last_record:
+                        overview = get_device_overview(st.session_state.mqtt_runner.get_data_version())
+                        last_record = overview["by_device"].get(selected_device) or {}
+                    context = dict(last_record)
+                    if last_record.get("device"):
+                        context["history_summary"] = history_summary(last_record["device"])
+                    reply = chatbot.ask(user_input, sensor_context=context)
                     st.markdown(f"""
                     <div class='info-card-modern'>
                         <strong>Jawaban dari Asisten Kesehatan:</strong><br><br>
@@ -310,11 +508,39 @@ with tab_monitoring:
 
         
     
-    # ============= AUTO REFRESH LOGIC =============
-    if st.session_state.auto_refresh:
-        time.sleep(1)
-        st.rerun()
-    
+    # ============= EXPORT DATA =============
+    st.markdown("<div class='section-header'>Export Data</div>", unsafe_allow_html=True)
+    overview_cache = st.session_state.get("device_overview")
+    export_devices_all = list(overview_cache["names"]) if overview_cache else []
+
+    exp_col1, exp_col2, exp_col3, exp_col4 = st.columns([3, 2, 1, 1])
+    with exp_col1:
+        export_devices = st.multiselect("Perangkat (kosong = semua)", export_devices_all, key="export_devices")
+    with exp_col2:
+        export_dates = st.date_input("Rentang tanggal", value=(datetime.now().date() - timedelta(days=30), datetime.now().date()), key="export_dates")
+    with exp_col3:
+        export_kind = st.selectbox("Data", ["raw", "rollup"], key="export_kind")
+    with exp_col4:
+        export_format = st.selectbox("Format", list(EXPORT_FORMATS), key="export_format")
+
+    export_range_complete = isinstance(export_dates, (tuple, list)) and len(export_dates) == 2
+    if export_range_complete and (export_dates[1] - export_dates[0]).days >= EXPORT_MAX_DAYS:
+        st.warning(f"Rentang export di dashboard maksimal {EXPORT_MAX_DAYS} hari. Untuk rentang lebih panjang gunakan: python export.py --output dump.csv.gz --start ... --end ...")
+    elif export_range_complete:
+        export_start = pd.Timestamp(export_dates[0])
+        export_end = pd.Timestamp(export_dates[1]) + pd.Timedelta(days=1) - pd.Timedelta(1)
+        # callable: export baru dijalankan saat tombol diklik, bukan tiap rerun
+        st.download_button(
+            "Download Export",
+            data=partial(export_download, export_devices or None, export_start, export_end, export_kind, export_format),
+            file_name=f"shhe_{export_kind}_{export_dates[0]:%Y%m%d}_{export_dates[1]:%Y%m%d}{EXPORT_FORMATS[export_format]}",
+            mime="application/octet-stream",
+            key="export_download",
+            use_container_width=True
+        )
+    else:
+        st.info("Pilih tanggal awal dan akhir untuk export.")
+
     # ============= FOOTER =============
     st.markdown("<div class='footer-card'><p style='color: #2dd9ce; font-size: 0.85rem; margin: 0; font-weight: 700;'> Smart Health Ecosystem © 2025 | Real-time Monitoring System </p></div>", unsafe_allow_html=True)
 
@@ -349,33 +575,7 @@ with tab_medicine:
                 times_1.append(time_input)
         
         if st.button("TAMBAH", key="add_schedule_1", use_container_width=True):
-            if medicine_name_1.strip() and start_date_1 and end_date_1 and times_1:
-                if start_date_1 <= end_date_1:
-                    schedules = []
-                    current_date = start_date_1
-                    while current_date <= end_date_1:
-                        for t in times_1:
-                            schedule_datetime = datetime.combine(current_date, t)
-                            schedules.append(schedule_datetime.strftime("%Y-%m-%d %H:%M"))
-                        current_date += timedelta(days=1)
-                    
-                    schedules = list(dict.fromkeys(schedules))
-                    existing_datetimes = set([s["datetime"] for s in st.session_state.medicine_schedules])
-                    new_schedules = [{"datetime": s, "medicine": medicine_name_1} for s in schedules if s not in existing_datetimes]
-                    
-                    if new_schedules:
-                        st.session_state.medicine_schedules.extend(new_schedules)
-                        new_datetimes = [s["datetime"] for s in new_schedules]
-                        if "mqtt_runner" in st.session_state:
-                            st.session_state.mqtt_runner.publish_obat(new_datetimes)
-
-                        st.success(f"Jadwal 1 ditambahkan: {len(new_schedules)} jadwal baru!")
-                    else:
-                        st.warning("Semua jadwal sudah ada dalam daftar.")
-                else:
-                    st.error("Tanggal mulai harus <= tanggal selesai!")
-            else:
-                st.error("Isi semua field!")
+            add_medicine_rule("Jadwal 1", medicine_name_1, start_date_1, end_date_1, times_1)
         
     # FORM 2
     with col_form2:
@@ -400,33 +600,7 @@ with tab_medicine:
                 times_2.append(time_input)
         
         if st.button("TAMBAH", key="add_schedule_2", use_container_width=True):
-            if medicine_name_2.strip() and start_date_2 and end_date_2 and times_2:
-                if start_date_2 <= end_date_2:
-                    schedules = []
-                    current_date = start_date_2
-                    while current_date <= end_date_2:
-                        for t in times_2:
-                            schedule_datetime = datetime.combine(current_date, t)
-                            schedules.append(schedule_datetime.strftime("%Y-%m-%d %H:%M"))
-                        current_date += timedelta(days=1)
-                    
-                    schedules = list(dict.fromkeys(schedules))
-                    existing_datetimes = set([s["datetime"] for s in st.session_state.medicine_schedules])
-                    new_schedules = [{"datetime": s, "medicine": medicine_name_2} for s in schedules if s not in existing_datetimes]
-                    
-                    if new_schedules:
-                        st.session_state.medicine_schedules.extend(new_schedules)
-                        new_datetimes = [s["datetime"] for s in new_schedules]
-                        if "mqtt_runner" in st.session_state:
-                            st.session_state.mqtt_runner.publish_obat(new_datetimes)
-
-                        st.success(f"Jadwal 2 ditambahkan: {len(new_schedules)} jadwal baru!")
-                    else:
-                        st.warning("Semua jadwal sudah ada dalam daftar.")
-                else:
-                    st.error("Tanggal mulai harus <= tanggal selesai!")
-            else:
-                st.error("Isi semua field!")
+            add_medicine_rule("Jadwal 2", medicine_name_2, start_date_2, end_date_2, times_2)
         
     # FORM 3
     with col_form3:
@@ -451,41 +625,16 @@ with tab_medicine:
                 times_3.append(time_input)
         
         if st.button("TAMBAH", key="add_schedule_3", use_container_width=True):
-            if medicine_name_3.strip() and start_date_3 and end_date_3 and times_3:
-                if start_date_3 <= end_date_3:
-                    schedules = []
-                    current_date = start_date_3
-                    while current_date <= end_date_3:
-                        for t in times_3:
-                            schedule_datetime = datetime.combine(current_date, t)
-                            schedules.append(schedule_datetime.strftime("%Y-%m-%d %H:%M"))
-                        current_date += timedelta(days=1)
-                    
-                    schedules = list(dict.fromkeys(schedules))
-                    existing_datetimes = set([s["datetime"] for s in st.session_state.medicine_schedules])
-                    new_schedules = [{"datetime": s, "medicine": medicine_name_3} for s in schedules if s not in existing_datetimes]
-                    
-                    if new_schedules:
-                        st.session_state.medicine_schedules.extend(new_schedules)
-                        new_datetimes = [s["datetime"] for s in new_schedules]
-                        if "mqtt_runner" in st.session_state:
-                            st.session_state.mqtt_runner.publish_obat(new_datetimes)
-
-                        st.success(f"Jadwal 3 ditambahkan: {len(new_schedules)} jadwal baru!")
-                    else:
-                        st.warning("Semua jadwal sudah ada dalam daftar.")
-                else:
-                    st.error("Tanggal mulai harus <= tanggal selesai!")
-            else:
-                st.error("Isi semua field!")
+            add_medicine_rule("Jadwal 3", medicine_name_3, start_date_3, end_date_3, times_3)
         
     
     # ============= STATISTIK JADWAL =============
     st.markdown("<div class='section-header'>Statistik Jadwal</div>", unsafe_allow_html=True)
     st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
     
-    total_schedules = len(st.session_state.medicine_schedules)
-    unique_medicines = len(set([s["medicine"] for s in st.session_state.medicine_schedules])) if st.session_state.medicine_schedules else 0
+    medicine_rules = [rule for _, rule in st.session_state.schedule_store.all()]
+    total_schedules = count_unique_doses(medicine_rules)
+    unique_medicines = len(set([r["medicine"] for r in medicine_rules])) if medicine_rules else 0
     
     col_stat_1, col_stat_2, col_stat_3 = st.columns(3)
     
@@ -507,26 +656,41 @@ with tab_medicine:
     
     with col_stat_3:
         if st.button("Hapus Semua Jadwal", key="clear_schedules", use_container_width=True):
-            st.session_state.medicine_schedules = []
+            st.session_state.schedule_store.clear()
+            st.session_state.schedule_dispatcher.clear()
             st.rerun()
     
     st.markdown("</div>", unsafe_allow_html=True)
     
     # ============= SCHEDULE LIST =============
-    if st.session_state.medicine_schedules:
+    if medicine_rules:
         st.markdown("<div class='section-header'>Daftar Jadwal Obat</div>", unsafe_allow_html=True)
         st.markdown("<div class='modern-card'>", unsafe_allow_html=True)
         
-        schedule_df = pd.DataFrame(st.session_state.medicine_schedules)
-        schedule_df = schedule_df.sort_values('datetime')
+        # hanya window tampilan yang diekspansi, bukan seluruh masa pengobatan
+        view_days = st.number_input("Tampilkan (hari ke depan)", min_value=1, max_value=90, value=7, key="schedule_view_days")
+        view_start = datetime.now().replace(second=0, microsecond=0)
+        view_end = view_start + timedelta(days=view_days)
+        
+        upcoming = st.session_state.schedule_dispatcher.upcoming(limit=5)
+        if upcoming:
+            st.markdown("<p style='color: #26d0ce; font-size: 0.9rem; font-weight: 700;'>Dosis Berikutnya:</p>", unsafe_allow_html=True)
+            st.dataframe(pd.DataFrame(upcoming), use_container_width=True, hide_index=True)
         
-        for medicine in schedule_df['medicine'].unique():
-            med_schedules = schedule_df[schedule_df['medicine'] == medicine]
-            with st.expander(f"Obat: {medicine} ({len(med_schedules)} jadwal)", expanded=False):
-                st.dataframe(med_schedules[['datetime', 'medicine']], use_container_width=True, hide_index=True, key=f"df_{medicine}")
+        for medicine in dict.fromkeys(r["medicine"] for r in medicine_rules):
+            med_rules = [r for r in medicine_rules if r["medicine"] == medicine]
+            with st.expander(f"Obat: {medicine} ({count_unique_doses(med_rules)} jadwal)", expanded=False):
+                st.dataframe(pd.DataFrame(med_rules), use_container_width=True, hide_index=True, key=f"rules_{medicine}")
+                med_window = expand_rules(med_rules, view_start, view_end)
+                if med_window:
+                    st.dataframe(pd.DataFrame(med_window), use_container_width=True, hide_index=True, key=f"df_{medicine}")
         
         st.markdown("<p style='color: #26d0ce; font-size: 0.9rem; font-weight: 700; margin-top: 1.5rem;'>Ringkasan Semua Jadwal:</p>", unsafe_allow_html=True)
-        st.dataframe(schedule_df, use_container_width=True, hide_index=True)
+        schedule_window = expand_rules(medicine_rules, view_start, view_end)
+        if schedule_window:
+            st.dataframe(pd.DataFrame(schedule_window), use_container_width=True, hide_index=True)
+        else:
+            st.info("Tidak ada jadwal dalam rentang tampilan.")
         
         st.markdown("</div>", unsafe_allow_html=True)
     else:
@@ -534,9 +698,3 @@ with tab_medicine:
     
     st.markdown("<div class='footer-card'><p style='color: #2dd9ce; font-size: 0.85rem; margin: 0; font-weight: 700;'> Smart Health Ecosystem © 2025 | Medicine Scheduler </p></div>", unsafe_allow_html=True)
 
-# ============= AUTO REFRESH LOGIC (GLOBAL) =============
-if st.session_state.auto_refresh:
-    time.sleep(1)
-    st.rerun()
-
-time.sleep(0.1)
\ No newline at end of file
@@ -119,6 +119,14 @@ class GeminiHealthChatbot:
                 f"Status AI: {sensor_context.get('ai', 'N/A')}",
             ])
 
+            summary = sensor_context.get("history_summary")
+            if summary:
+                context_lines.append(
+                    f"Rata-rata {summary['window']} terakhir ({summary['samples']} data): "
+                    f"suhu {summary['temp']:.1f}°C, kelembapan {summary['hum']:.1f}%, gas {summary['gas']:.0f}, "
+                    f"status terparah {summary['worst_ai']}"
+                )
+
             # Interpretasi otomatis sederhana
             temp_val = sensor_context.get('temp', 0)
             hum_val = sensor_context.get('hum', 0)
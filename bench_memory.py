@@ -0,0 +1,318 @@
+"""
+Benchmark memory footprint state per device dan dashboard.
+
+- devices: byte per device yang dilacak (ModelService.history/last +
+  MQTTRunner.last_timestamp/device_states/device_versions) untuk 1k/10k/100k device
+- rerun: puncak alokasi (tracemalloc) dan RSS per rerun dashboard (AppTest)
+  untuk history data.csv sintetis N baris
+- replay: pertumbuhan memori selama replay panjang dengan set device tetap
+
+Tiap skenario jalan di proses Python baru. Pesan melewati
+MQTTRunner._on_message asli; hanya tulis CSV dan RandomForest yang
+dilewati, sehingga yang terukur adalah state yang tertahan di memori.
+
+Budget opsional membuat exit code != 0 jika terlampaui (untuk CI):
+
+    python bench_memory.py
+    python bench_memory.py --rows 100000,1000000,10000000 --max-rerun-peak-mb 2000
+    python bench_memory.py --max-bytes-per-device 4096 --max-growth-kb 16 --json memory.json
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+DEVICE_COUNTS = [1_000, 10_000, 100_000]
+ROW_COUNTS = [100_000, 1_000_000]
+SCENARIOS = ["devices", "rerun", "replay"]
+BASE_TS = datetime(2026, 1, 1)
+DEQUE_BLOCK = 64
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _mb(n_bytes):
+    return round(n_bytes / 2**20, 1)
+
+
+# ---------------- STREAMING STATE ----------------
+def _state_only_runner(tmp_dir):
+    from model import ModelService
+    from mqtt_client import MQTTRunner
+
+    class _StateOnlyModel(ModelService):
+        # compute_features & state per device asli, tanpa RandomForest
+        def predict_from_features(self, features):
+            return "GOOD"
+
+    runner = MQTTRunner("127.0.0.1", 1883, model_path=None, csv_path=os.path.join(tmp_dir, "data.csv"))
+    runner.model = _StateOnlyModel({"model": None})
+    runner._append_csv = lambda row: None
+    return runner
+
+
+def _message(device, seq, i):
+    payload = {
+        "device": device,
+        "ts": (BASE_TS + timedelta(seconds=seq)).strftime("%Y-%m-%d %H:%M:%S"),
+        "temp": 20.0 + i % 17,
+        "hum": 40.0 + i % 31,
+        "gas": 300.0 + i % 97,
+        "heartrate": 60.0 + i % 41,
+    }
+    return SimpleNamespace(payload=json.dumps(payload).encode())
+
+
+def _by_file(snapshot, base, top=5):
+    stats = snapshot.compare_to(base, "filename")
+    return {os.path.basename(s.traceback[0].filename): s.size_diff for s in stats[:top] if s.size_diff > 0}
+
+
+def measure_devices(n, messages_per_device=4):
+    """Byte per device setelah setiap device mengirim beberapa pesan (deque roll_size penuh)."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        runner = _state_only_runner(tmp_dir)
+        gc.collect()
+        rss0 = rss_mb()
+        tracemalloc.start()
+        base = tracemalloc.take_snapshot()
+        t0 = time.perf_counter()
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            for seq in range(messages_per_device):
+                for i in range(n):
+                    runner._on_message(runner.client, None, _message(f"dev-{i:06d}", seq, i + seq))
+        seconds = time.perf_counter() - t0
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        return {
+            "devices": n,
+            "tracked": {"history": len(runner.model.history), "last": len(runner.model.last),
+                        "last_timestamp": len(runner.last_timestamp), "device_states": len(runner.device_states),
+                        "device_versions": len(runner.device_versions)},
+            "bytes_per_device": round(current / n),
+            "rss_per_device": round((rss_mb() - rss0) * 2**20 / n),
+            "by_file": _by_file(snapshot, base),
+            "seconds": round(seconds, 2),
+        }
+
+
+def measure_replay(devices, messages):
+    """
+    Traced memory & RSS per sampel; growth = slope setelah sampel pertama
+    (byte per 1k pesan). Device dikirimi pesan bergiliran dan sampel diambil
+    tiap DEQUE_BLOCK pesan per device: deque(maxlen) CPython berpindah blok
+    64 slot, jadi pada titik itu semua deque kembali ke fase yang sama dan
+    osilasi alokasi blok tidak terbaca sebagai growth.
+    """
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        runner = _state_only_runner(tmp_dir)
+        gc.collect()
+        tracemalloc.start()
+        step = devices * DEQUE_BLOCK
+        trace = []
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            for i in range(messages):
+                runner._on_message(runner.client, None, _message(f"dev-{i % devices:06d}", i // devices, i))
+                if (i + 1) % step == 0:
+                    gc.collect()
+                    trace.append({"messages": i + 1, "traced_mb": _mb(tracemalloc.get_traced_memory()[0]),
+                                  "rss_mb": round(rss_mb(), 1)})
+        tracemalloc.stop()
+
+    steady = trace[1:]
+    growth_kb = 0.0
+    if len(steady) >= 2:
+        x = np.array([t["messages"] for t in steady], dtype=float)
+        y = np.array([t["traced_mb"] for t in steady], dtype=float) * 1024
+        growth_kb = float(np.polyfit(x, y, 1)[0] * 1000)
+    return {"devices": devices, "messages": messages, "growth_kb_per_1k_messages": round(growth_kb, 2),
+            "final_traced_mb": trace[-1]["traced_mb"] if trace else 0.0, "trace": trace}
+
+
+# ---------------- DASHBOARD RERUN ----------------
+def write_history(path, rows, devices=100, chunksize=500_000):
+    """
+    data.csv sintetis (format sama dengan MQTTRunner) ditulis per chunk;
+    baris terakhir = sekarang, sehingga seluruh history masih dalam raw_days.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    labels = np.array(["GOOD", "ALERT", "DANGER"])
+    base = pd.Timestamp.now().floor("s") - pd.Timedelta(seconds=(rows - 1) // devices)
+    header = True
+    for start in range(0, rows, chunksize):
+        n = min(chunksize, rows - start)
+        idx = np.arange(start, start + n)
+        ts = base + pd.to_timedelta(idx // devices, unit="s")
+        pd.DataFrame({
+            "ts": ts.strftime("%Y-%m-%d %H:%M:%S"),
+            "device": np.char.add("dev-", (idx % devices).astype(str)),
+            "temp": rng.normal(30, 3, n).round(2),
+            "hum": rng.normal(60, 10, n).round(2),
+            "gas": rng.normal(400, 120, n).round(1),
+            "ai": labels[rng.choice(3, n, p=[0.8, 0.15, 0.05])],
+            "heartrate": rng.normal(80, 12, n).round(1),
+        }).to_csv(path, mode="w" if header else "a", header=header, index=False)
+        header = False
+
+
+def measure_rerun(rows, reruns=3, devices=100):
+    """
+    Run pertama (cold) lalu `reruns` rerun; sebelum tiap rerun data_version
+    dinaikkan seperti saat pesan baru masuk, sehingga dashboard menghitung ulang
+    overview, gauge dan grafik dari index history.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "data.csv")
+        write_history(csv_path, rows, devices)
+        gc.collect()
+
+        at = AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=1800)
+        at.secrets["MQTT_BROKER"] = "127.0.0.1"
+        at.secrets["MQTT_PORT"] = 1883
+        at.secrets["CSV_PATH"] = csv_path
+        at.secrets["STATE_SNAPSHOT_PATH"] = ""  # jangan timpa snapshot state asli
+        # arsip & jadwal sintetis tetap di tmp_dir, bukan archive/ dan schedules.db asli
+        at.secrets["ARCHIVE_DIR"] = os.path.join(tmp_dir, "archive")
+        at.secrets["SCHEDULE_DB_PATH"] = os.path.join(tmp_dir, "schedules.db")
+
+        tracemalloc.start()
+        runs = []
+        for i in range(reruns + 1):
+            if i:
+                runner = at.session_state["mqtt_runner"]
+                runner.model_ready.wait(timeout=120)
+                with runner.lock:
+                    runner.data_version += 1
+            gc.collect()
+            tracemalloc.reset_peak()
+            t0 = time.perf_counter()
+            at.run()
+            _, peak = tracemalloc.get_traced_memory()
+            runs.append({"run": "cold" if i == 0 else "rerun", "seconds": round(time.perf_counter() - t0, 2),
+                         "peak_mb": _mb(peak), "rss_mb": round(rss_mb(), 1),
+                         "exceptions": [e.message for e in at.exception]})
+        tracemalloc.stop()
+
+    reruns_only = [r for r in runs if r["run"] == "rerun"] or runs
+    return {"rows": rows, "runs": runs, "rerun_peak_mb": max(r["peak_mb"] for r in reruns_only)}
+
+
+WORKERS = {"devices": measure_devices, "replay": measure_replay, "rerun": measure_rerun}
+RESULT_TAG = "BENCH_JSON "
+
+
+def _run_worker(name, **kwargs):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", name, json.dumps(kwargs)],
+                         cwd=HERE, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr else "failed")
+    # app/thread latar bisa mencetak log setelah hasil; ambil baris bertanda saja
+    lines = [line for line in out.stdout.splitlines() if line.startswith(RESULT_TAG)]
+    if not lines:
+        raise RuntimeError(f"worker {name} tidak mengirim hasil")
+    return json.loads(lines[-1][len(RESULT_TAG):])
+
+
+def _int_list(value):
+    return [int(float(v)) for v in value.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark memory footprint")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help="skenario dipisah koma: devices,rerun,replay")
+    parser.add_argument("--devices", type=_int_list, default=DEVICE_COUNTS, help="jumlah device, mis. 1000,10000,100000")
+    parser.add_argument("--rows", type=_int_list, default=ROW_COUNTS, help="ukuran history, mis. 100000,1000000,10000000")
+    parser.add_argument("--reruns", type=int, default=3)
+    parser.add_argument("--replay-devices", type=int, default=100)
+    parser.add_argument("--replay-messages", type=int, default=200_000)
+    parser.add_argument("--max-bytes-per-device", type=float, help="budget state per device (byte)")
+    parser.add_argument("--max-rerun-peak-mb", type=float, help="budget puncak alokasi per rerun dashboard")
+    parser.add_argument("--max-growth-kb", type=float, help="budget pertumbuhan per 1k pesan saat steady state")
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args, rest = parser.parse_known_args()
+
+    if args.worker:
+        print(RESULT_TAG + json.dumps(WORKERS[args.worker](**json.loads(rest[0]))), flush=True)
+        sys.exit(0)
+
+    only = set(args.only.split(","))
+    result = {}
+    failures = []
+
+    if "devices" in only:
+        result["devices"] = []
+        for n in args.devices:
+            row = _run_worker("devices", n=n)
+            result["devices"].append(row)
+            print(f"devices {n:>8d}  {row['bytes_per_device']:>6d} B/device traced  "
+                  f"{row['rss_per_device']:>6d} B/device RSS  {row['by_file']}")
+            if args.max_bytes_per_device is not None and row["bytes_per_device"] > args.max_bytes_per_device:
+                failures.append(f"{n} devices: {row['bytes_per_device']} B/device > {args.max_bytes_per_device:.0f}")
+
+    if "rerun" in only:
+        result["rerun"] = []
+        for rows in args.rows:
+            try:
+                row = _run_worker("rerun", rows=rows, reruns=args.reruns)
+            except RuntimeError as e:
+                failures.append(f"rerun {rows} rows failed: {e}")
+                continue
+            result["rerun"].append(row)
+            for r in row["runs"]:
+                print(f"rerun   {rows:>8d} rows  {r['run']:5s} {r['peak_mb']:>8.1f} MB peak  "
+                      f"{r['rss_mb']:>8.1f} MB RSS  {r['seconds']:.1f}s")
+                if r["exceptions"]:
+                    failures.append(f"app raised with {rows} rows: {r['exceptions']}")
+            if args.max_rerun_peak_mb is not None and row["rerun_peak_mb"] > args.max_rerun_peak_mb:
+                failures.append(f"{rows} rows: rerun peak {row['rerun_peak_mb']} MB > {args.max_rerun_peak_mb:.0f} MB")
+
+    if "replay" in only:
+        if args.replay_messages < 3 * args.replay_devices * DEQUE_BLOCK:
+            print(f"[BENCH] replay: butuh >= {3 * args.replay_devices * DEQUE_BLOCK} pesan untuk mengukur growth")
+        row = _run_worker("replay", devices=args.replay_devices, messages=args.replay_messages)
+        result["replay"] = row
+        print(f"replay  {row['messages']} messages / {row['devices']} devices  "
+              f"{row['growth_kb_per_1k_messages']} KB per 1k messages  final {row['final_traced_mb']} MB traced")
+        if args.max_growth_kb is not None and row["growth_kb_per_1k_messages"] > args.max_growth_kb:
+            failures.append(f"replay growth {row['growth_kb_per_1k_messages']} KB/1k > {args.max_growth_kb} KB/1k")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+
+    if failures:
+        print("[BENCH] FAILED:", "; ".join(failures))
+        sys.exit(1)
@@ -0,0 +1,127 @@
+"""
+Benchmark cold start dashboard.
+
+- waktu import per modul, masing-masing di proses Python baru (cold)
+- waktu first render: satu run app.py via streamlit AppTest di proses baru
+- waktu sampai model selesai dimuat di background
+
+Budget opsional membuat exit code != 0 jika terlampaui (untuk CI):
+
+    python bench_startup.py
+    python bench_startup.py --max-render-ms 3000 --json startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = [
+    "streamlit",
+    "pandas",
+    "numpy",
+    "paho.mqtt.client",
+    "plotly.graph_objects",
+    "google.generativeai",
+    "joblib",
+    "sklearn.ensemble",
+    "mqtt_client",
+    "model",
+    "charts",
+    "assistant",
+]
+
+_IMPORT_SNIPPET = "import time; t0 = time.perf_counter(); import {mod}; print((time.perf_counter() - t0) * 1000)"
+
+RESULT_TAG = "BENCH_JSON "
+
+_RENDER_SNIPPET = """
+import json, time
+from streamlit.testing.v1 import AppTest
+t0 = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.secrets["MQTT_BROKER"] = "127.0.0.1"
+at.secrets["MQTT_PORT"] = 1883
+at.secrets["STATE_SNAPSHOT_PATH"] = ""
+# salinan di direktori sementara: data.csv, archive/ dan schedules.db asli tidak disentuh
+at.secrets["CSV_PATH"] = {csv!r}
+at.secrets["ARCHIVE_DIR"] = {archive!r}
+at.secrets["SCHEDULE_DB_PATH"] = {schedule_db!r}
+at.run()
+render_ms = (time.perf_counter() - t0) * 1000
+runner = at.session_state["mqtt_runner"]
+runner.model_ready.wait(timeout=120)
+model_ms = (time.perf_counter() - t0) * 1000
+print({tag!r} + json.dumps({{"first_render_ms": render_ms, "model_ready_ms": model_ms,
+                  "exceptions": [e.message for e in at.exception]}}), flush=True)
+"""
+
+
+def _run(code):
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr else "failed")
+    # log [STATE]/[MQTT] dari thread latar bisa muncul setelah hasil; utamakan baris bertanda
+    lines = out.stdout.strip().splitlines()
+    tagged = [line[len(RESULT_TAG):] for line in lines if line.startswith(RESULT_TAG)]
+    return tagged[-1] if tagged else lines[-1]
+
+
+def import_times():
+    results = {}
+    for mod in MODULES:
+        try:
+            results[mod] = round(float(_run(_IMPORT_SNIPPET.format(mod=mod))), 1)
+        except RuntimeError as e:
+            print(f"[BENCH] import {mod} gagal: {e}")
+            results[mod] = None
+    return results
+
+
+def render_time():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "data.csv")
+        if os.path.exists(os.path.join(HERE, "data.csv")):
+            shutil.copyfile(os.path.join(HERE, "data.csv"), csv_path)
+        code = _RENDER_SNIPPET.format(
+            app=os.path.join(HERE, "app.py"), tag=RESULT_TAG, csv=csv_path,
+            archive=os.path.join(tmp_dir, "archive"), schedule_db=os.path.join(tmp_dir, "schedules.db"),
+        )
+        return json.loads(_run(code))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cold start dashboard")
+    parser.add_argument("--max-render-ms", type=float, help="budget first render")
+    parser.add_argument("--max-import-ms", type=float, help="budget import per modul proyek")
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    args = parser.parse_args()
+
+    result = {"imports_ms": import_times(), "render": render_time()}
+    for mod, ms in result["imports_ms"].items():
+        print(f"import {mod:24s} {ms} ms")
+    render = result["render"]
+    print(f"first render            {render['first_render_ms']:.0f} ms")
+    print(f"model ready             {render['model_ready_ms']:.0f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+
+    failures = []
+    if render["exceptions"]:
+        failures.append(f"app raised: {render['exceptions']}")
+    if args.max_render_ms is not None and render["first_render_ms"] > args.max_render_ms:
+        failures.append(f"first render {render['first_render_ms']:.0f} ms > {args.max_render_ms:.0f} ms")
+    if args.max_import_ms is not None:
+        for mod in ("mqtt_client", "model", "charts", "assistant"):
+            ms = result["imports_ms"].get(mod)
+            if ms is not None and ms > args.max_import_ms:
+                failures.append(f"import {mod} {ms} ms > {args.max_import_ms:.0f} ms")
+    if failures:
+        print("[BENCH] FAILED:", "; ".join(failures))
+        sys.exit(1)
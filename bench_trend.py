@@ -0,0 +1,100 @@
+"""
+Benchmark grafik tren: waktu server (bangun figure + serialisasi JSON yang
+dikirim Streamlit) untuk window 200, 10k dan 100k titik.
+
+Waktu frame browser tidak bisa diukur dari Python; gunakan --html untuk
+menulis halaman yang mengukur Plotly.newPlot per ukuran via
+performance.now() (buka di browser, hasil tampil di halaman & console).
+
+    python bench_trend.py
+    python bench_trend.py --html bench_trend.html
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from charts import TrendFigureCache, build_trend_figure, select_window, WEBGL_THRESHOLD
+
+SIZES = [200, 10_000, 100_000]
+
+
+def synthetic_history(n):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "ts": pd.date_range("2026-01-01", periods=n, freq="s"),
+        "device": "bench",
+        "temp": 25 + rng.normal(0, 1, n),
+        "hum": 60 + rng.normal(0, 3, n),
+        "gas": 500 + rng.normal(0, 50, n),
+        "ai": "GOOD",
+        "heartrate": 80 + rng.normal(0, 5, n),
+    })
+
+
+def _timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, out
+
+
+def run():
+    results = []
+    for n in SIZES:
+        df = synthetic_history(n)
+        build_ms, fig = _timed(lambda: build_trend_figure(select_window(df, "Semua")))
+        json_ms, payload = _timed(lambda: fig.to_json())
+
+        cache = TrendFigureCache()
+        cache.get(df, 0, "Semua")
+        hit_ms, _ = _timed(lambda: cache.get(df, 0, "Semua"))
+
+        grown = pd.concat([df, synthetic_history(10).assign(ts=lambda d: d["ts"] + pd.Timedelta(seconds=n))], ignore_index=True)
+        entry = {"fig": build_trend_figure(select_window(df, "Semua"))}
+        append_ms, _ = _timed(lambda: TrendFigureCache._append(entry, grown, "Semua"), repeat=1)
+
+        results.append({
+            "points": n,
+            "trace": "Scattergl" if n > WEBGL_THRESHOLD else "Scatter",
+            "build_ms": round(build_ms, 2),
+            "to_json_ms": round(json_ms, 2),
+            "payload_kb": round(len(payload) / 1024, 1),
+            "cache_hit_ms": round(hit_ms, 3),
+            "append_10_ms": round(append_ms, 2),
+        })
+    return results
+
+
+def write_html(path):
+    import plotly.io as pio
+
+    parts = ["<html><head><script src='https://cdn.plot.ly/plotly-2.35.2.min.js'></script></head><body><pre id='out'></pre>"]
+    for n in SIZES:
+        fig = build_trend_figure(select_window(synthetic_history(n), "Semua"))
+        parts.append(f"<div id='p{n}'></div><script>var fig{n} = {pio.to_json(fig)};</script>")
+    parts.append("<script>\n(async function() {\n  const out = document.getElementById('out');\n")
+    for n in SIZES:
+        parts.append(
+            f"  {{ const t0 = performance.now(); await Plotly.newPlot('p{n}', fig{n}.data, fig{n}.layout);\n"
+            f"    await new Promise(r => requestAnimationFrame(() => r()));\n"
+            f"    const ms = (performance.now() - t0).toFixed(1); out.textContent += '{n} points: ' + ms + ' ms\\n'; console.log('{n}', ms); }}\n"
+        )
+    parts.append("})();\n</script></body></html>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark render grafik tren")
+    parser.add_argument("--html", help="tulis halaman benchmark frame browser ke path ini")
+    args = parser.parse_args()
+
+    for row in run():
+        print(row)
+    if args.html:
+        write_html(args.html)
+        print("Browser benchmark ditulis ke", args.html)
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# di atas jumlah titik ini trace memakai WebGL (Scattergl)
+WEBGL_THRESHOLD = 5000
+
+TIME_RANGES = {
+    "200 data terakhir": None,
+    "1 jam": pd.Timedelta(hours=1),
+    "24 jam": pd.Timedelta(hours=24),
+    "7 hari": pd.Timedelta(days=7),
+    "Semua": None,
+}
+RESOLUTIONS = {
+    "Raw": None,
+    "1 menit": "1min",
+    "5 menit": "5min",
+    "1 jam": "1h",
+}
+TAIL_POINTS = 200
+
+# (kolom, nama, warna, fill, mode, yaxis, skala)
+TREND_TRACES = [
+    ("temp", "Temperature", "#ff6b6b", "rgba(255, 107, 107, 0.1)", "lines", "y1", 1),
+    ("hum", "Humidity", "#1db8a0", "rgba(29, 184, 160, 0.1)", "lines", "y2", 1),
+    ("gas", "Gas (÷10)", "#2dd9ce", "rgba(45, 217, 206, 0.1)", "lines", "y3", 10),
+    ("heartrate", "Heart Rate", "#f44336", None, "lines+markers", "y4", 1),
+]
+
+
+def select_window(df, time_range="200 data terakhir", resolution="Raw"):
+    """Potong df sesuai rentang waktu lalu (opsional) resample ke resolusi."""
+    if time_range == "200 data terakhir":
+        recent = df.tail(TAIL_POINTS)
+    elif TIME_RANGES.get(time_range) is not None and not df.empty:
+        cutoff = df["ts"].iloc[-1] - TIME_RANGES[time_range]
+        recent = df[df["ts"] >= cutoff]
+    else:
+        recent = df
+
+    rule = RESOLUTIONS.get(resolution)
+    if rule and not recent.empty:
+        cols = [c for c, *_ in TREND_TRACES if c in recent.columns]
+        recent = (recent.dropna(subset=["ts"]).set_index("ts")[cols]
+                  .resample(rule).mean().dropna(how="all").reset_index())
+    return recent
+
+
+def query_window(history, device, time_range="200 data terakhir", resolution="Raw"):
+    """
+    Seperti select_window, tetapi dibaca dari index history (history.SensorHistory):
+    hanya baris dalam rentang yang dimaterialisasi, termasuk segmen arsip.
+    """
+    columns = [c for c, *_ in TREND_TRACES]
+    span = TIME_RANGES.get(time_range)
+    start, limit = None, None
+    if time_range == "200 data terakhir":
+        limit = TAIL_POINTS
+    elif span is not None:
+        last_ts, _ = history.query(device, columns=[], limit=1)
+        if len(last_ts):
+            start = int(last_ts[-1]) - span.value
+    return history.query_frame(device, start, None, columns, RESOLUTIONS.get(resolution), limit)
+
+
+def _trace_values(recent, col, scale):
+    y = recent[col].to_numpy()
+    return y / scale if scale != 1 else y
+
+
+def build_trend_figure(recent):
+    use_gl = len(recent) > WEBGL_THRESHOLD
+    scatter = go.Scattergl if use_gl else go.Scatter
+    x = recent["ts"].to_numpy()
+
+    fig_trend = go.Figure()
+    for col, name, color, fillcolor, mode, yaxis, scale in TREND_TRACES:
+        if col not in recent.columns:
+            continue
+        kwargs = dict(x=x, y=_trace_values(recent, col, scale), name=name,
+                      line=dict(color=color, width=3), mode=mode, yaxis=yaxis)
+        if fillcolor:
+            kwargs.update(fill="tonexty", fillcolor=fillcolor)
+        fig_trend.add_trace(scatter(**kwargs))
+
+    fig_trend.update_layout(
+        hovermode='x unified',
+        plot_bgcolor='rgba(15, 31, 30, 0.5)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(29, 184, 160, 0.15)',
+            color='#2dd9ce',
+            tickformat='%Y-%m-%d %H:%M:%S'
+        ),
+        height=320,
+        margin=dict(l=60, r=30, t=30, b=60),
+        font={'family': 'Poppins', 'color': '#2dd9ce', 'size': 11},
+        legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="right", x=1, bgcolor='rgba(25, 35, 33, 0.9)', bordercolor='rgba(29, 184, 160, 0.25)', borderwidth=2),
+        yaxis=dict(showgrid=True, gridcolor='rgba(29, 184, 160, 0.15)', color='#2dd9ce', title='Temp/Humidity/Gas'),
+        yaxis2=dict(showgrid=False, color='#2dd9ce', overlaying='y', side='right'),
+        yaxis3=dict(showgrid=False, color='#2dd9ce', overlaying='y', side='right'),
+        yaxis4=dict(showgrid=False, color='#f44336', overlaying='y', side='right')
+    )
+    return fig_trend
+
+
+class TrendFigureCache:
+    """
+    Cache figure per (data version, rentang, resolusi).
+    Jika hanya ada baris baru (data append-only) dan resolusi Raw,
+    titik baru (dicari lewat timestamp, sehingga df boleh berupa window
+    dari query_window) di-append ke trace yang ada tanpa membangun ulang layout.
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self.entries = {}
+
+    def cached(self, version, time_range="200 data terakhir", resolution="Raw"):
+        """Figure untuk version ini jika ada, tanpa perlu membaca data."""
+        entry = self.entries.get((time_range, resolution))
+        return entry["fig"] if entry is not None and entry["version"] == version else None
+
+    def get(self, df, version, time_range="200 data terakhir", resolution="Raw"):
+        key = (time_range, resolution)
+        entry = self.entries.get(key)
+        if entry is not None and entry["version"] == version:
+            return entry["fig"]
+
+        fig = None
+        if entry is not None and RESOLUTIONS.get(resolution) is None:
+            fig = self._append(entry, df, time_range)
+        if fig is None:
+            fig = build_trend_figure(select_window(df, time_range, resolution))
+
+        self.entries.pop(key, None)
+        self.entries[key] = {"version": version, "fig": fig}
+        while len(self.entries) > self.max_entries:
+            self.entries.pop(next(iter(self.entries)))
+        return fig
+
+    @staticmethod
+    def _append(entry, df, time_range):
+        fig = entry["fig"]
+        if not fig.data or len(fig.data[0].x) == 0 or df.empty:
+            return None
+        # df terurut waktu (bisa berupa window); baris baru = setelah titik terakhir figure,
+        # termasuk baris lain dengan timestamp yang sama dengan titik terakhir itu
+        old_x = np.asarray(fig.data[0].x)
+        ts = df["ts"].to_numpy()
+        pos = int(np.searchsorted(ts, old_x[-1], side="left")) + int((old_x == old_x[-1]).sum())
+        if pos == 0 or pos > len(ts) or ts[pos - 1] != old_x[-1]:
+            return None  # data diganti (mis. reload): bangun ulang
+        new = df.iloc[pos:]
+        if new.empty:
+            return fig
+
+        x = np.concatenate([old_x, new["ts"].to_numpy()])
+        if time_range == "200 data terakhir":
+            start = max(0, len(x) - TAIL_POINTS)
+        elif TIME_RANGES.get(time_range) is not None:
+            start = int(np.searchsorted(x, x[-1] - TIME_RANGES[time_range].to_timedelta64()))
+        else:
+            start = 0
+
+        # ganti jenis trace jika melewati ambang WebGL
+        use_gl = (len(x) - start) > WEBGL_THRESHOLD
+        if use_gl != isinstance(fig.data[0], go.Scattergl):
+            return None
+
+        with fig.batch_update():
+            traces = [t for t in TREND_TRACES if t[0] in df.columns]
+            for trace, (col, _, _, _, _, _, scale) in zip(fig.data, traces):
+                y = np.concatenate([np.asarray(trace.y), _trace_values(new, col, scale)])
+                trace.x = x[start:]
+                trace.y = y[start:]
+        return fig
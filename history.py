@@ -0,0 +1,340 @@
+"""
+Query rentang waktu atas history sensor.
+
+Per device, kolom disimpan sebagai array NumPy kontigu dengan index
+timestamp int64 (epoch ns) yang terurut, sehingga query device + rentang
+cukup dua binary search (np.searchsorted) lalu slice tanpa memindai baris
+lain. Sumber: segmen raw di archive/ + data.csv; baris baru dari data.csv
+dibaca inkremental lewat offset byte (refresh). Rentang yang raw-nya sudah
+di-rollup (retention apply_policy) diisi dari segmen rollup (rata-rata per jam).
+
+In-process:
+    history = SensorHistory("data.csv", "archive")
+    ts, cols = history.query("Smart Home Health Ecosystem", start, end, ["temp", "gas"])
+
+HTTP (localhost):
+    python history.py --serve --port 8765
+    GET /devices
+    GET /query?device=...&start=2026-01-10T19:00&end=...&columns=temp,gas&resolution=1min
+"""
+import argparse
+import io
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from retention import SensorLogRetention, SEVERITY, severity_codes
+
+NUMERIC_COLUMNS = ["temp", "hum", "gas", "heartrate"]
+ALL_COLUMNS = NUMERIC_COLUMNS + ["ai"]
+
+
+def to_epoch_ns(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return pd.Timestamp(value).value
+
+
+class _DeviceSeries:
+    """Buffer kolom yang tumbuh (kapasitas x2) dengan ts terurut."""
+
+    def __init__(self):
+        self.n = 0
+        self.ts = np.empty(0, dtype=np.int64)
+        self.cols = {c: np.empty(0, dtype=np.float64) for c in NUMERIC_COLUMNS}
+        self.cols["ai"] = np.empty(0, dtype=np.int8)
+
+    def append(self, ts, cols):
+        m = len(ts)
+        if m == 0:
+            return
+        in_order = self.n == 0 or ts[0] >= self.ts[self.n - 1]
+        if in_order and np.all(ts[1:] >= ts[:-1]):
+            if self.n + m > len(self.ts):
+                cap = max(1024, 2 * (self.n + m))
+                self.ts = _grow(self.ts, cap, self.n)
+                self.cols = {c: _grow(a, cap, self.n) for c, a in self.cols.items()}
+            self.ts[self.n:self.n + m] = ts
+            for c, a in self.cols.items():
+                a[self.n:self.n + m] = cols[c]
+            self.n += m
+            return
+
+        # data tidak urut: gabung lalu sort stabil (jarang terjadi)
+        all_ts = np.concatenate([self.ts[:self.n], ts])
+        order = np.argsort(all_ts, kind="stable")
+        self.ts = all_ts[order]
+        self.cols = {c: np.concatenate([a[:self.n], cols[c]])[order] for c, a in self.cols.items()}
+        self.n = len(self.ts)
+
+    def window(self, start_ns=None, end_ns=None):
+        ts = self.ts[:self.n]
+        i = 0 if start_ns is None else int(np.searchsorted(ts, start_ns, side="left"))
+        j = self.n if end_ns is None else int(np.searchsorted(ts, end_ns, side="right"))
+        return i, j
+
+
+def _grow(arr, cap, n):
+    out = np.empty(cap, dtype=arr.dtype)
+    out[:n] = arr[:n]
+    return out
+
+
+def _readonly(arr):
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
+
+class SensorHistory:
+    def __init__(self, csv_path="data.csv", archive_dir="archive", include_archive=True):
+        self.csv_path = csv_path
+        self.archive_dir = archive_dir
+        self.include_archive = include_archive
+        self.lock = threading.RLock()
+        self.devices = {}
+        self._offset = 0
+        self._header = None
+        self._inode = None
+        self.reload()
+
+    # ---------------- LOADING ----------------
+    def _ingest(self, df):
+        if df.empty:
+            return
+        ts = pd.to_datetime(df["ts"], errors="coerce", format="mixed")
+        valid = ts.notna().to_numpy()
+        df = df[valid]
+        ts = ts[valid].astype("datetime64[ns]").to_numpy().view(np.int64)
+
+        cols = {c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64) if c in df.columns
+                else np.full(len(df), np.nan) for c in NUMERIC_COLUMNS}
+        ai = df["ai"] if "ai" in df.columns else pd.Series("", index=df.index)
+        cols["ai"] = severity_codes(ai).fillna(-1).to_numpy(dtype=np.int8)
+
+        device = df["device"].fillna("").astype(str).to_numpy()
+        codes, names = pd.factorize(device)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.r_[0, np.flatnonzero(np.diff(codes[order])) + 1, len(order)]
+        for k in range(len(bounds) - 1):
+            idx = order[bounds[k]:bounds[k + 1]]
+            name = names[codes[idx[0]]]
+            series = self.devices.setdefault(name, _DeviceSeries())
+            series.append(ts[idx], {c: a[idx] for c, a in cols.items()})
+
+    def _ingest_rollup(self, df):
+        # rollup hanya mengisi waktu sebelum raw pertama device (raw lebih detail)
+        if df.empty:
+            return
+        ts = pd.to_datetime(df["ts"], errors="coerce", format="mixed").astype("datetime64[ns]")
+        first_ns = {name: int(series.ts[0]) for name, series in self.devices.items() if series.n}
+        first = df["device"].fillna("").astype(str).map(first_ns)
+        keep = first.isna().to_numpy() | (ts.to_numpy().view(np.int64) < first.fillna(0).to_numpy(dtype=np.int64))
+        self._ingest(df[keep])
+
+    def reload(self):
+        with self.lock:
+            self.devices = {}
+            if self.include_archive:
+                retention = SensorLogRetention(self.csv_path, self.archive_dir)
+                for entry in retention.segments_for(kinds=("raw",)):
+                    self._ingest(pd.read_csv(os.path.join(self.archive_dir, entry["file"])))
+                for entry in retention.segments_for(kinds=("rollup",)):
+                    self._ingest_rollup(pd.read_csv(os.path.join(self.archive_dir, entry["file"])))
+            self._offset = 0
+            self._header = None
+            self.refresh()
+
+    def refresh(self):
+        """Baca baris yang ditambahkan ke data.csv sejak refresh terakhir."""
+        with self.lock:
+            try:
+                st = os.stat(self.csv_path)
+            except OSError:
+                return 0
+            if self._inode is not None and (st.st_ino != self._inode or st.st_size < self._offset):
+                # file dirotasi/diganti: barisnya kini ada di segmen arsip
+                self._inode = st.st_ino
+                self.reload()
+                return -1
+            self._inode = st.st_ino
+            if st.st_size == self._offset:
+                return 0
+
+            with open(self.csv_path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            # hanya baris lengkap; sisa baris parsial dibaca pada refresh berikutnya
+            end = data.rfind(b"\n") + 1
+            if end == 0:
+                return 0
+            data = data[:end]
+            if self._header is None:
+                nl = data.find(b"\n") + 1
+                self._header = data[:nl]
+                data = data[nl:]
+                self._offset += nl
+            self._offset += len(data)
+            if not data.strip():
+                return 0
+
+            df = pd.read_csv(io.BytesIO(self._header + data), dtype={"ts": str, "device": str})
+            self._ingest(df)
+            return len(df)
+
+    # ---------------- QUERY ----------------
+    def device_names(self):
+        with self.lock:
+            return sorted(self.devices)
+
+    def last_records(self):
+        """Baris terakhir tiap device sebagai dict (format record MQTTRunner)."""
+        out = {}
+        with self.lock:
+            for name, series in self.devices.items():
+                if series.n == 0:
+                    continue
+                k = series.n - 1
+                record = {"ts": str(pd.Timestamp(int(series.ts[k]))), "device": name}
+                for c in NUMERIC_COLUMNS:
+                    value = float(series.cols[c][k])
+                    record[c] = 0.0 if np.isnan(value) else value
+                code = int(series.cols["ai"][k])
+                record["ai"] = SEVERITY[code] if code >= 0 else "N/A"
+                out[name] = record
+        return out
+
+    def query(self, device, start=None, end=None, columns=None, resolution=None, limit=None):
+        """
+        Return (ts int64 epoch ns, {kolom: array}). Tanpa resolution: view
+        read-only (tanpa salin). Dengan resolution (mis. '1min'): rata-rata
+        per bucket, label ai = yang paling parah. `limit`: hanya sejumlah
+        baris terakhir dalam rentang (sebelum bucketing).
+        """
+        columns = list(ALL_COLUMNS if columns is None else columns)
+        with self.lock:
+            series = self.devices.get(device)
+            if series is None:
+                return np.empty(0, dtype=np.int64), {c: np.empty(0) for c in columns}
+            i, j = series.window(to_epoch_ns(start), to_epoch_ns(end))
+            if limit is not None:
+                i = max(i, j - limit)
+            ts = series.ts[i:j]
+            cols = {c: series.cols[c][i:j] for c in columns}
+
+        if resolution is None:
+            return _readonly(ts), {c: _readonly(a) for c, a in cols.items()}
+        return _bucket(ts, cols, pd.Timedelta(resolution).value)
+
+    def query_frame(self, device, start=None, end=None, columns=None, resolution=None, limit=None):
+        ts, cols = self.query(device, start, end, columns, resolution, limit)
+        df = pd.DataFrame({"ts": pd.to_datetime(ts)})
+        for c, a in cols.items():
+            df[c] = pd.Series(np.asarray(SEVERITY + ["UNKNOWN"], dtype=object)[a]) if c == "ai" else a
+        df.insert(1, "device", device)
+        return df
+
+
+def _bucket(ts, cols, res_ns):
+    if res_ns <= 0:
+        raise ValueError("resolution must be positive")
+    if len(ts) == 0:
+        return ts.copy(), {c: a.copy() for c, a in cols.items()}
+    ids = ts // res_ns
+    starts = np.r_[0, np.flatnonzero(np.diff(ids)) + 1]
+    out = {}
+    for c, a in cols.items():
+        if c == "ai":
+            out[c] = np.maximum.reduceat(a, starts)
+            continue
+        finite = ~np.isnan(a)
+        sums = np.add.reduceat(np.where(finite, a, 0.0), starts)
+        counts = np.add.reduceat(finite.astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[c] = sums / counts
+    return ids[starts] * res_ns, out
+
+
+# ---------------- HTTP ----------------
+def make_handler(history):
+    class HistoryHandler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            history.refresh()
+            if url.path == "/devices":
+                return self._send(200, {"devices": history.device_names()})
+            if url.path != "/query":
+                return self._send(404, {"error": "not found"})
+            if "device" not in params:
+                return self._send(400, {"error": "device is required"})
+            try:
+                columns = params["columns"].split(",") if params.get("columns") else None
+                unknown = set(columns or []) - set(ALL_COLUMNS)
+                if unknown:
+                    return self._send(400, {"error": f"unknown columns {sorted(unknown)}"})
+                ts, cols = history.query(params["device"], params.get("start"), params.get("end"),
+                                         columns, params.get("resolution"))
+            except (ValueError, TypeError) as e:
+                return self._send(400, {"error": str(e)})
+
+            payload = {"device": params["device"], "ts": (ts // 1_000_000).tolist()}
+            for c, a in cols.items():
+                if c == "ai":
+                    payload[c] = [SEVERITY[v] if v >= 0 else None for v in a.tolist()]
+                else:
+                    payload[c] = [None if np.isnan(v) else v for v in a.tolist()]
+            self._send(200, payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return HistoryHandler
+
+
+def serve(history, host="127.0.0.1", port=8765):
+    """Jalankan endpoint HTTP di thread daemon; return server."""
+    server = ThreadingHTTPServer((host, port), make_handler(history))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[HISTORY] Serving on http://{host}:{port}")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query rentang waktu history sensor")
+    parser.add_argument("--csv", default="data.csv")
+    parser.add_argument("--archive", default="archive")
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--device")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--columns")
+    parser.add_argument("--resolution")
+    args = parser.parse_args()
+
+    history = SensorHistory(args.csv, args.archive)
+    if args.serve:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(history))
+        print(f"[HISTORY] Serving on http://127.0.0.1:{args.port}")
+        server.serve_forever()
+    elif args.device:
+        columns = args.columns.split(",") if args.columns else None
+        print(history.query_frame(args.device, args.start, args.end, columns, args.resolution).to_string(index=False, max_rows=50))
+    else:
+        print(history.device_names())
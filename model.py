@@ -1,9 +1,17 @@
-import joblib
 import numpy as np
 import pandas as pd
 from collections import deque
 import os
 
+# urutan kolom compute_features / predict_batch (nama default jika pkl tidak menyimpan "features")
+FEATURE_NAMES = [
+    "temp", "hum", "gas",
+    "d_temp", "d_hum", "d_gas",
+    "r_temp", "r_hum", "r_gas",
+    "heartrate",
+    "trend_temp", "trend_gas",
+]
+
 class ModelService:
     def __init__(self, model_source, roll_size=3):
         """
@@ -30,6 +38,12 @@ class ModelService:
         self.roll_size = roll_size
 
 
+    def adopt_state(self, other):
+        """Pakai state per device milik `other` (dict yang sama, bukan salinan) untuk hot-reload."""
+        self.history = other.history
+        self.last = other.last
+        self.roll_size = other.roll_size
+
     # ---------------- INTERNAL ----------------
     def _ensure_device(self, device):
         if device not in self.history:
@@ -84,20 +98,19 @@ class ModelService:
     
     # ---------------- PREDICTION ----------------
     def predict_from_features(self, features):
-        arr = np.asarray(features)
+        # satu baris: jalur yang sama dengan predict_batch (model + rule engine)
+        return str(self.predict_batch(features)[0])
+
+
+    def _model_input(self, features):
+        arr = np.asarray(features, dtype=float)
         if arr.ndim == 1:
             arr = arr.reshape(1, -1)
 
     # Build DataFrame for scaler (it needs feature names)
         feat_names = self.features
         if feat_names is None:
-            feat_names = [
-                "temp","hum","gas",
-                "d_temp","d_hum","d_gas",
-                "r_temp","r_hum","r_gas",
-                "heartrate",
-                "trend_temp","trend_gas"
-            ]
+            feat_names = FEATURE_NAMES
 
         X_df = pd.DataFrame(arr, columns=feat_names)
 
@@ -111,40 +124,35 @@ class ModelService:
             X_scaled = X_df.values
 
     # RandomForest was trained WITHOUT feature names → give numpy
-        X_final = np.asarray(X_scaled)
+        return np.asarray(X_scaled)
 
-        pred = int(self.model.predict(X_final)[0])
-        ai_label = {0:"GOOD",1:"ALERT",2:"DANGER"}.get(pred, "UNKNOWN")
-
-    # ================= RULE ENGINE =================
-        vals = X_final[0] if isinstance(X_final, np.ndarray) else X_final.values[0]
-
-        temp, hum, gas, d_temp, d_hum, d_gas, r_temp, r_hum, r_gas, hr, trend_temp, trend_gas = vals
+    def predict_classes(self, features):
+        """Kelas mentah RandomForest (0/1/2) tanpa rule engine, untuk validasi model baru."""
+        return np.asarray(self.model.predict(self._model_input(features))).astype(int)
 
+    def predict_batch(self, features):
+        """
+        Prediksi banyak baris sekaligus (streaming lewat predict_from_features,
+        rescoring offline): RandomForest lalu rule engine. Return array label.
+        """
+        X_final = self._model_input(features)
+        pred = np.asarray(self.model.predict(X_final)).astype(int)
+        # severity: 0 GOOD, 1 ALERT, 2 DANGER, -1 UNKNOWN
+        sev = np.where(np.isin(pred, [0, 1, 2]), pred, -1)
 
-        rule_label = ai_label
+    # ================= RULE ENGINE =================
+        temp, hum, gas, d_temp, d_hum, d_gas, r_temp, r_hum, r_gas, hr, trend_temp, trend_gas = X_final.T
 
     # ----- GAS rules -----
-        if gas > 1200 or r_gas > 1000:
-            rule_label = "DANGER" 
-        elif gas > 700:
-            rule_label = max(rule_label, "ALERT", key=["GOOD","ALERT","DANGER"].index)
-
+        sev = np.where((gas > 1200) | (r_gas > 1000), 2,
+                       np.where(gas > 700, np.maximum(sev, 1), sev))
     # ----- Temperature rules -----
-        if temp > 38 or temp < 18:
-            rule_label = "ALERT"
-
+        sev = np.where((temp > 38) | (temp < 18), 1, sev)
     # ----- Heart rate rules -----
-        if hr > 140 or hr < 40:
-            rule_label = "DANGER"
-        elif hr > 110:
-            rule_label = max(rule_label, "ALERT", key=["GOOD","ALERT","DANGER"].index)
-
+        sev = np.where((hr > 140) | (hr < 40), 2,
+                       np.where(hr > 110, np.maximum(sev, 1), sev))
     # ----- Trend danger -----
-        if trend_gas > 80 or trend_temp > 2:
-            rule_label = max(rule_label, "ALERT", key=["GOOD","ALERT","DANGER"].index)
-
+        sev = np.where((trend_gas > 80) | (trend_temp > 2), np.maximum(sev, 1), sev)
     # ==============================================
 
-        return rule_label
-
+        return np.array(["GOOD", "ALERT", "DANGER", "UNKNOWN"])[sev]
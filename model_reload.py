@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from model import ModelService, FEATURE_NAMES
+
+N_FEATURES = 12
+VALID_LABELS = {"GOOD", "ALERT", "DANGER"}
+# batas bawah kesamaan kelas RandomForest dengan model aktif pada probe sintetis;
+# pkl hasil train.py dari data.csv contoh ~0.6 sama dengan model bawaan
+DEFAULT_MIN_AGREEMENT = 0.5
+
+
+def probe_features(n=64, seed=0):
+    """Baris fitur sintetis (lewat compute_features) untuk smoke test model baru."""
+    rng = np.random.default_rng(seed)
+    state = ModelService({"model": None})
+    rows = []
+    for i in range(n):
+        device = f"probe-{i % 4}"
+        rows.append(state.compute_features(
+            device,
+            temp=float(rng.uniform(15, 42)),
+            hum=float(rng.uniform(20, 95)),
+            gas=float(rng.uniform(100, 1500)),
+            heartrate=float(rng.choice([0, rng.uniform(40, 160)])),
+        ))
+    return rows
+
+
+def validate_model(candidate, current=None, min_agreement=None):
+    """
+    Return (ok, reason). Cek daftar fitur dan parity: semua probe harus
+    menghasilkan label valid, dan (opsional) kelas RandomForest-nya cukup sering
+    sama dengan model aktif dan tidak konstan. Kelas dibandingkan sebelum rule
+    engine, karena rule engine menimpa sebagian besar label probe.
+    """
+    features = candidate.features
+    if features is not None and len(features) != N_FEATURES:
+        return False, f"expected {N_FEATURES} features, got {len(features)}"
+    # nama fitur sama dengan model aktif, atau FEATURE_NAMES (urutan compute_features, dipakai train.py)
+    if current is not None and current.features is not None and features is not None \
+            and list(features) not in (list(current.features), FEATURE_NAMES):
+        return False, "feature list differs from the active model and from FEATURE_NAMES"
+
+    probes = probe_features()
+    try:
+        labels = [candidate.predict_from_features(f) for f in probes]
+    except Exception as e:
+        return False, f"prediction failed: {e}"
+    if not set(labels) <= VALID_LABELS:
+        return False, f"unexpected labels {set(labels) - VALID_LABELS}"
+
+    if current is not None:
+        rows = np.vstack(probes)
+        candidate_classes, current_classes = candidate.predict_classes(rows), current.predict_classes(rows)
+        # pkl yang memprediksi satu kelas untuk semua probe (mis. selalu GOOD) ditolak
+        if len(set(candidate_classes)) == 1 and len(set(current_classes)) > 1:
+            return False, f"model predicts class {candidate_classes[0]} for every probe"
+    if min_agreement is not None and current is not None:
+        agree = float(np.mean(candidate_classes == current_classes))
+        if agree < min_agreement:
+            return False, f"agreement {agree:.2f} < {min_agreement:.2f}"
+    return True, "ok"
+
+
+class ModelReloader:
+    """
+    Polling file pkl; jika berubah (dan ukurannya stabil satu interval),
+    model baru dimuat & divalidasi di thread ini lalu di-swap ke MQTTRunner
+    tanpa menghentikan ingest. Dengan shadow=True model baru hanya ikut
+    menilai (runner.get_shadow_stats) sampai runner.promote_shadow() dipanggil.
+    """
+
+    def __init__(self, runner, model_path, interval=5.0, shadow=False, min_agreement=DEFAULT_MIN_AGREEMENT):
+        self.runner = runner
+        self.model_path = model_path
+        self.interval = interval
+        self.shadow = shadow
+        self.min_agreement = min_agreement
+        self.loaded_signature = self._signature()
+        self._seen_signature = self.loaded_signature
+        self._stop = threading.Event()
+        self.thread = None
+
+    def _signature(self):
+        try:
+            st = os.stat(self.model_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run_loop(self):
+        while not self._stop.wait(self.interval):
+            sig = self._signature()
+            if sig is None or sig == self.loaded_signature:
+                continue
+            if sig != self._seen_signature:
+                # file mungkin masih ditulis; tunggu satu interval lagi
+                self._seen_signature = sig
+                continue
+            self.loaded_signature = sig
+            self.reload()
+
+    def reload(self):
+        self.runner.model_ready.wait()
+        current = self.runner.model
+        t0 = time.perf_counter()
+        try:
+            candidate = ModelService(model_source=self.model_path,
+                                     roll_size=current.roll_size if current is not None else 3)
+        except Exception as e:
+            print("[RELOAD] Failed to load model:", e)
+            return False
+
+        ok, reason = validate_model(candidate, current, self.min_agreement)
+        if not ok:
+            print("[RELOAD] Rejected new model:", reason)
+            return False
+
+        if self.shadow and current is not None:
+            self.runner.set_shadow_model(candidate)
+        else:
+            self.runner.swap_model(candidate)
+        print(f"[RELOAD] New model ready in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        return True
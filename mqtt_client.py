@@ -2,45 +2,128 @@ import json
 import threading
 import os
 from datetime import datetime
+from collections import OrderedDict
 import pandas as pd
 import paho.mqtt.client as mqtt
-from model import ModelService
 
 TOPIC_DATA = "SHHE/data"
 TOPIC_STATUS = "SHHE/status"
+# SHHE/obat       : pengingat dosis jatuh tempo {"schedules": [when], "medicine"} dari
+#                   ScheduleDispatcher; satu-satunya payload obat yang dieksekusi firmware
+# SHHE/obat/rules : salinan rule ringkas {"rules": [...]} untuk sinkronisasi/tampilan saja,
+#                   bukan pemicu pengingat (firmware tidak subscribe topik ini untuk alarm)
 TOPIC_OBAT = "SHHE/obat"
+TOPIC_OBAT_RULES = "SHHE/obat/rules"
+MODEL_LOAD_TIMEOUT = 30
 
 class MQTTRunner:
-    def __init__(self, broker, port, model_path="models/smarthealth.retrained.pkl", csv_path="data.csv"):
+    def __init__(self, broker, port, model_path="models/smarthealth.retrained.pkl", csv_path="data.csv", retention=None,
+                 state_path=None):
         self.broker = broker
         self.port = port
+        self.retention = retention
+        self.state_path = state_path
         self.client = mqtt.Client()
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.lock = threading.Lock()
+        self.data_version = 0
         self.last_status = "N/A"
         self.latest_record = None
+        # state terakhir per device + data version update terakhirnya, urut dari yang
+        # paling lama diupdate; pembaca hanya mengambil device yang berubah (get_device_changes)
+        self.device_states = {}
+        self.device_versions = OrderedDict()
         self.last_timestamp = {}
+        # dedupe + update state fitur per device; dipegang juga oleh StateSnapshotter
+        self.state_lock = threading.Lock()
+        self.shadow_model = None
+        self.shadow_stats = {"total": 0, "disagree": 0, "pairs": {}}
 
-        # load model
-        # baru
-        # mqtt_client.py bagian __init__
+        # load model di background (joblib + sklearn lambat diimport);
+        # pesan yang datang sebelum model siap menunggu model_ready
         self.model = None
+        self.model_ready = threading.Event()
         if model_path:  # tetap pakai model_path sebagai argumen
-           try:
-        # panggil ModelService dengan model_source, bisa path atau dict
-                  self.model = ModelService(model_source=model_path)
-           except Exception as e:
-                  print("[MQTT] Warning: Failed to load model:", e)
-
+            threading.Thread(target=self._load_model, args=(model_path,), daemon=True).start()
+        else:
+            self.model_ready.set()
 
         self.csv_path = csv_path
         try:
-            pd.read_csv(self.csv_path)
+            pd.read_csv(self.csv_path, nrows=0)
         except Exception:
             df = pd.DataFrame(columns=["ts", "device", "temp", "hum", "gas", "ai", "heartrate"])
             df.to_csv(self.csv_path, index=False)
 
+    def _load_model(self, model_path):
+        try:
+            from model import ModelService
+            # panggil ModelService dengan model_source, bisa path atau dict
+            model = ModelService(model_source=model_path)
+            if self.state_path is not None:
+                self._restore_state(model)
+            self.model = model
+        except Exception as e:
+            print("[MQTT] Warning: Failed to load model:", e)
+        finally:
+            self.model_ready.set()
+
+    def _restore_state(self, model):
+        # warm restart: snapshot + replay tail history, sebelum pesan pertama diproses
+        try:
+            from state_snapshot import restore_state
+            archive_dir = self.retention.archive_dir if self.retention is not None else None
+            restore_state(model, self.last_timestamp, self.state_path, self.csv_path, archive_dir)
+        except Exception as e:
+            print("[MQTT] Warning: Failed to restore device state:", e)
+
+    # ---------------- MODEL HOT-RELOAD ----------------
+    def swap_model(self, new_model):
+        """Ganti model secara atomik; state per device (history/last) tetap dipakai."""
+        old = self.model
+        if old is not None:
+            new_model.adopt_state(old)
+        self.model = new_model
+        self.shadow_model = None
+        print("[MQTT] Model swapped")
+
+    def set_shadow_model(self, shadow_model):
+        shadow_model.adopt_state(self.model)
+        with self.lock:
+            self.shadow_stats = {"total": 0, "disagree": 0, "pairs": {}}
+        self.shadow_model = shadow_model
+        print("[MQTT] Shadow model active")
+
+    def promote_shadow(self):
+        shadow = self.shadow_model
+        if shadow is not None:
+            self.swap_model(shadow)
+
+    def _score_shadow(self, features, label):
+        shadow = self.shadow_model
+        if shadow is None:
+            return
+        try:
+            shadow_label = shadow.predict_from_features(features)
+        except Exception as e:
+            print("[MQTT] Shadow prediction error:", e)
+            return
+        with self.lock:
+            stats = self.shadow_stats
+            stats["total"] += 1
+            if shadow_label != label:
+                stats["disagree"] += 1
+                pair = f"{label}->{shadow_label}"
+                stats["pairs"][pair] = stats["pairs"].get(pair, 0) + 1
+
+    def get_shadow_stats(self):
+        with self.lock:
+            stats = dict(self.shadow_stats, pairs=dict(self.shadow_stats["pairs"]))
+        stats["active"] = self.shadow_model is not None
+        stats["disagree_rate"] = stats["disagree"] / stats["total"] if stats["total"] else 0.0
+        return stats
+
     def _on_connect(self, client, userdata, flags, rc):
         print("[MQTT] Connected, subscribing ...")
         client.subscribe(TOPIC_DATA)
@@ -69,16 +152,21 @@ class MQTTRunner:
 
             # AI prediction
             label = "GOOD"
-            if self.model is not None:
+            self.model_ready.wait(timeout=MODEL_LOAD_TIMEOUT)
+            # referensi lokal: hot-reload bisa mengganti self.model di tengah pesan
+            model = self.model
+            if model is not None:
                 try:
-                    if hasattr(self.model, "predict_from_features"):
-                        last_ts = self.last_timestamp.get(device)
-                        if last_ts and ts <= last_ts:
-                            return   # drop packet lama / duplicate
-
-                        self.last_timestamp[device] = ts
-                        features = self.model.compute_features(device, temp, hum, gas, ts, heartrate)
-                        label = self.model.predict_from_features(features)
+                    if hasattr(model, "predict_from_features"):
+                        with self.state_lock:
+                            last_ts = self.last_timestamp.get(device)
+                            if last_ts and ts <= last_ts:
+                                return   # drop packet lama / duplicate
+
+                            self.last_timestamp[device] = ts
+                            features = model.compute_features(device, temp, hum, gas, ts, heartrate)
+                        label = model.predict_from_features(features)
+                        self._score_shadow(features, label)
                     else:
                         print("[MQTT] Warning: self.model bukan ModelService, skipping AI prediction")
                 except Exception as e:
@@ -97,6 +185,10 @@ class MQTTRunner:
             with self.lock:
                 self.last_status = label
                 self.latest_record = row
+                self.device_states[device] = row
+                self.data_version += 1
+                self.device_versions[device] = self.data_version
+                self.device_versions.move_to_end(device)
 
             print(f"[MQTT] {device} {ts} => T:{temp}°C H:{hum}% G:{gas} HR:{heartrate}BPM => {label}")
 
@@ -104,17 +196,10 @@ class MQTTRunner:
             print("[MQTT] on_message error:", e)
 
     def _append_csv(self, row):
+        # append satu baris; rotasi dijalankan RetentionMaintainer di thread lain
         with self.lock:
-            try:
-                df = pd.read_csv(self.csv_path)
-            except:
-                df = pd.DataFrame(columns=row.keys())
-
-        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-
-        tmp = self.csv_path + ".tmp"
-        df.to_csv(tmp, index=False)
-        os.replace(tmp, self.csv_path)
+            header = not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0
+            pd.DataFrame([row]).to_csv(self.csv_path, mode="a", header=header, index=False)
 
 
     def start(self):
@@ -135,13 +220,47 @@ class MQTTRunner:
             self.client.publish(TOPIC_OBAT, json.dumps(payload))
             print("[MQTT] Published schedules:", schedules)
 
+    def publish_obat_rules(self, rules):
+        # rule ringkas (medicine, start, end, times, frequency); informasi saja, lihat TOPIC_OBAT_RULES
+        if rules:
+            payload = {"rules": rules}
+            self.client.publish(TOPIC_OBAT_RULES, json.dumps(payload))
+            print("[MQTT] Published schedule rules:", len(rules))
+
+    def publish_obat_due(self, medicine, when):
+        # dipanggil ScheduleDispatcher tepat saat dosis jatuh tempo
+        payload = {"schedules": [when], "medicine": medicine}
+        self.client.publish(TOPIC_OBAT, json.dumps(payload))
+        print("[MQTT] Published due dose:", medicine, when)
+
     def get_last_status(self):
         with self.lock:
             return self.last_status
 
-    def get_latest_record(self):
+    def get_latest_record(self, device=None):
         with self.lock:
+            if device is not None:
+                return self.device_states.get(device)
             return self.latest_record
 
+    def get_device_changes(self, since_version=0):
+        """
+        Return (data_version, {device: record}) untuk device yang diupdate setelah
+        since_version. Biaya sebanding jumlah device yang berubah, bukan semua device;
+        record tidak diubah setelah disimpan, jadi aman dibagi tanpa salinan.
+        """
+        changes = {}
+        with self.lock:
+            for device in reversed(self.device_versions):
+                if self.device_versions[device] <= since_version:
+                    break
+                changes[device] = self.device_states[device]
+            return self.data_version, changes
+
+    def get_data_version(self):
+        # naik setiap ada record baru; dashboard hanya refresh jika berubah
+        with self.lock:
+            return self.data_version
+
     def get_csv_path(self):
         return self.csv_path
@@ -0,0 +1,261 @@
+"""
+Rescoring offline history sensor (segmen raw arsip + data.csv) dengan model saat ini.
+
+History dibaca per chunk. Fitur stateful (delta, rolling mean roll_size,
+trend) dihitung dengan operasi groupby vektor per device, lalu diprediksi
+sekaligus lewat ModelService.predict_batch. Device dibagi ke beberapa
+partisi yang dikerjakan paralel oleh process pool. Antar chunk, tail
+roll_size baris per device dibawa sebagai konteks (juga antar segmen
+arsip) agar hasilnya sama dengan jalur streaming (MQTTRunner -> compute_features).
+Label yang tidak diskor ulang (duplikat) ditulis persis seperti teks aslinya.
+
+--in-place hanya menimpa segmen raw di arsip (--archive). data.csv aktif
+masih di-append MQTTRunner, jadi tidak ditimpa kecuali --writer-stopped;
+rotasi dulu (python retention.py --rotate) agar barisnya ikut di arsip.
+
+    python rescore.py --input data.csv --output data.rescored.csv
+    python rescore.py --archive archive --in-place --workers 4
+    python rescore.py --check-parity 500
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import zlib
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model import ModelService
+from retention import SensorLogRetention, EXTENSIONS
+
+MODEL_PATH = "models/smarthealth_retrained.pkl"
+SENSOR_COLUMNS = ["temp", "hum", "gas", "heartrate"]
+# ai dibaca sebagai teks agar label lama tidak berubah ("0" bukan "0.0") tergantung chunk
+READ_DTYPES = {"ts": str, "device": str, "ai": str}
+
+_worker_model = None
+
+
+# ---------------- FEATURES ----------------
+def build_features(df, roll_size=3):
+    """
+    df: baris satu/lebih device dalam urutan kedatangan, kolom ts (string),
+    device, temp, hum, gas, heartrate. Return (mask baris yang diterima,
+    matriks fitur n x 12 untuk baris tersebut) dengan urutan kolom sama
+    seperti ModelService.compute_features.
+    """
+    # dedupe seperti MQTTRunner: buang ts <= ts terbesar sebelumnya per device
+    codes = pd.Series(pd.factorize(df["ts"].astype(str), sort=True)[0], index=df.index)
+    prev_max = codes.groupby(df["device"], sort=False).cummax().groupby(df["device"], sort=False).shift()
+    keep = (prev_max.isna() | (codes > prev_max)).to_numpy()
+
+    kept = df[keep]
+    g = kept.groupby("device", sort=False)
+    first = (g.cumcount() == 0).to_numpy()
+
+    raw = kept[["temp", "hum", "gas"]].to_numpy(dtype=float)
+    deltas = g[["temp", "hum", "gas"]].diff().to_numpy(dtype=float, copy=True)
+    deltas[first] = 0.0
+
+    rolling = (g[["temp", "hum", "gas"]].rolling(roll_size, min_periods=1).mean()
+               .reset_index(level=0, drop=True).loc[kept.index].to_numpy(dtype=float))
+
+    r = pd.DataFrame(rolling[:, [0, 2]], index=kept.index, columns=["r_temp", "r_gas"])
+    trends = r.groupby(kept["device"], sort=False).diff().to_numpy(dtype=float, copy=True)
+    trends[first] = 0.0
+
+    hr = kept["heartrate"].to_numpy(dtype=float)
+    hr = np.where(np.isnan(hr), 0.0, hr)
+
+    features = np.column_stack([raw, deltas, rolling, hr, trends])
+    return keep, features
+
+
+def _load_chunk(chunk):
+    chunk = chunk.copy()
+    chunk["ts"] = chunk["ts"].astype(str)
+    chunk["device"] = chunk["device"].fillna("").astype(str)
+    for col in SENSOR_COLUMNS:
+        chunk[col] = pd.to_numeric(chunk[col], errors="coerce")
+    for col in ("temp", "hum", "gas"):
+        chunk[col] = chunk[col].fillna(0.0)
+    return chunk
+
+
+# ---------------- WORKER ----------------
+def _init_worker(model_path):
+    global _worker_model
+    _worker_model = ModelService(model_source=model_path)
+
+
+def score_partition(part, carry, roll_size=3):
+    """
+    part: baris baru satu partisi; carry: tail baris yang diterima dari chunk
+    sebelumnya (konteks). Return (label per index part, jumlah duplikat, carry baru).
+    """
+    combined = pd.concat([carry, part]) if carry is not None and not carry.empty else part
+    is_new = np.r_[np.zeros(len(combined) - len(part), dtype=bool), np.ones(len(part), dtype=bool)]
+
+    keep, features = build_features(combined, roll_size)
+    labels = pd.Series(np.nan, index=part.index, dtype=object)
+    kept_new = is_new[keep]
+    if kept_new.any():
+        predicted = _worker_model.predict_batch(features[kept_new])
+        labels.loc[combined.index[keep & is_new]] = predicted
+
+    accepted = combined[keep]
+    new_carry = accepted.groupby("device", sort=False).tail(roll_size)
+    duplicates = int((~keep & is_new).sum())
+    return labels, duplicates, new_carry
+
+
+def _partition_of(device, n):
+    return zlib.crc32(device.encode("utf-8")) % n
+
+
+def archive_sources(csv_path="data.csv", archive_dir="archive"):
+    """Segmen raw di arsip, urut waktu (index.json)."""
+    retention = SensorLogRetention(csv_path, archive_dir)
+    return [os.path.join(archive_dir, e["file"]) for e in retention.segments_for(kinds=("raw",))]
+
+
+def _compression_of(path):
+    return next((c for c, ext in EXTENSIONS.items() if path.endswith(ext)), None)
+
+
+def rescore(input_path, output_path, model_path=MODEL_PATH, chunksize=100_000, workers=None, roll_size=3):
+    """
+    input_path/output_path: satu path, atau list path berpasangan yang diproses
+    berurutan (mis. segmen arsip lalu data.csv) dengan konteks per device
+    dibawa antar file. Output ditulis ke <output>.tmp lalu os.replace.
+    """
+    inputs = [input_path] if isinstance(input_path, str) else list(input_path)
+    outputs = [output_path] if isinstance(output_path, str) else list(output_path)
+    workers = workers or os.cpu_count() or 1
+    carries = [None] * workers
+    totals = {"rows": 0, "duplicates": 0, "files": 0}
+    t0 = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+        for src, dst in zip(inputs, outputs):
+            tmp = dst + ".tmp"
+            compression = _compression_of(dst)
+            header = True
+            for chunk in pd.read_csv(src, chunksize=chunksize, dtype=READ_DTYPES):
+                chunk = _load_chunk(chunk)
+                part_ids = chunk["device"].map(lambda d: _partition_of(d, workers))
+
+                futures = {}
+                for p, part in chunk.groupby(part_ids, sort=False):
+                    futures[p] = pool.submit(score_partition, part, carries[p], roll_size)
+
+                labels = pd.Series(np.nan, index=chunk.index, dtype=object)
+                for p, fut in futures.items():
+                    part_labels, dups, carries[p] = fut.result()
+                    labels.update(part_labels)
+                    totals["duplicates"] += dups
+
+                # duplikat (tidak pernah diskor oleh streaming) mempertahankan label lama
+                chunk["ai"] = labels.where(labels.notna(), chunk["ai"])
+                chunk.to_csv(tmp, mode="w" if header else "a", header=header, index=False, compression=compression)
+                header = False
+                totals["rows"] += len(chunk)
+                print(f"[RESCORE] {totals['rows']} rows ({time.perf_counter() - t0:.1f}s)")
+            if header:
+                pd.read_csv(src, nrows=0).to_csv(tmp, index=False, compression=compression)
+
+            os.replace(tmp, dst)
+            totals["files"] += 1
+            print(f"[RESCORE] {src} -> {dst}")
+
+    totals["seconds"] = round(time.perf_counter() - t0, 2)
+    return totals
+
+
+# ---------------- PARITY ----------------
+def check_parity(input_path, model_path=MODEL_PATH, n_rows=500, roll_size=3, chunksize=37, workers=3):
+    """
+    Bandingkan jalur batch dengan replay streaming (compute_features +
+    predict_from_features): build_features satu chunk di proses ini, lalu
+    rescore() penuh dengan chunk kecil dan beberapa worker (carry antar chunk).
+    """
+    raw = pd.read_csv(input_path, nrows=n_rows, dtype=READ_DTYPES)
+    df = _load_chunk(raw)
+
+    streaming = ModelService(model_source=model_path, roll_size=roll_size)
+    last_ts = {}
+    expected = raw["ai"].copy()
+    stream_rows, stream_labels = [], []
+    for row in df.itertuples():
+        if row.device in last_ts and row.ts <= last_ts[row.device]:
+            continue
+        last_ts[row.device] = row.ts
+        hr = 0.0 if np.isnan(row.heartrate) else row.heartrate
+        f = streaming.compute_features(row.device, row.temp, row.hum, row.gas, row.ts, hr)
+        stream_rows.append(f[0])
+        stream_labels.append(streaming.predict_from_features(f))
+        expected.loc[row.Index] = stream_labels[-1]
+
+    _init_worker(model_path)
+    keep, features = build_features(df, roll_size)
+    batch_labels = _worker_model.predict_batch(features)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src, dst = os.path.join(tmp_dir, "input.csv"), os.path.join(tmp_dir, "output.csv")
+        raw.to_csv(src, index=False)
+        with redirect_stdout(io.StringIO()):
+            rescore(src, dst, model_path, chunksize=chunksize, workers=workers, roll_size=roll_size)
+        chunked = pd.read_csv(dst, dtype=READ_DTYPES)["ai"]
+
+    stream_rows = np.array(stream_rows).reshape(-1, 12)
+    ok = (len(stream_rows) == len(features)
+          and np.allclose(stream_rows, features, rtol=1e-9, atol=1e-9)
+          and list(stream_labels) == list(batch_labels)
+          and chunked.equals(expected))
+    mismatched = int(sum(a != b for a, b in zip(stream_labels, batch_labels)))
+    chunk_mismatched = int((chunked.fillna("") != expected.fillna("")).sum())
+    return ok, {"rows": len(df), "scored": int(keep.sum()), "label_mismatches": mismatched,
+                "rescore_mismatches": chunk_mismatched, "chunksize": chunksize, "workers": workers}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescoring offline history sensor")
+    parser.add_argument("--input", default="data.csv")
+    parser.add_argument("--output", help="default: <input>.rescored.csv")
+    parser.add_argument("--archive", help="ikut rescore segmen raw di direktori arsip ini (sebelum --input)")
+    parser.add_argument("--in-place", action="store_true", help="timpa segmen arsip (dan --input jika --writer-stopped)")
+    parser.add_argument("--writer-stopped", action="store_true",
+                        help="dashboard/MQTTRunner sudah dihentikan; --in-place boleh menimpa --input")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--roll-size", type=int, default=3)
+    parser.add_argument("--check-parity", type=int, metavar="N", help="hanya cek parity pada N baris pertama")
+    args = parser.parse_args()
+
+    if args.check_parity:
+        ok, info = check_parity(args.input, args.model, args.check_parity, args.roll_size)
+        print("[RESCORE] Parity", "OK" if ok else "FAILED", info)
+        sys.exit(0 if ok else 1)
+
+    segments = archive_sources(args.input, args.archive) if args.archive else []
+    if args.in_place and not args.writer_stopped:
+        # baris yang di-append MQTTRunner selama rescore akan hilang saat os.replace
+        if not segments:
+            parser.error("--in-place tidak menimpa data.csv aktif; jalankan retention.py --rotate lalu "
+                         "--archive, atau hentikan dashboard dan tambahkan --writer-stopped")
+        inputs, outputs = segments, list(segments)
+    else:
+        output = args.input if args.in_place else (args.output or os.path.splitext(args.input)[0] + ".rescored.csv")
+        if args.in_place:
+            inputs, outputs = segments + [args.input], segments + [output]
+        elif segments:
+            parser.error("--archive hanya bisa dipakai dengan --in-place")
+        else:
+            inputs, outputs = [args.input], [output]
+    print("[RESCORE] Done:", rescore(inputs, outputs, args.model, args.chunksize, args.workers, args.roll_size))
@@ -0,0 +1,324 @@
+"""
+Retensi log sensor (data.csv):
+- rotasi file aktif berdasarkan ukuran atau pergantian hari
+- segmen tertutup dikompres (gzip, atau zstd jika paket `zstandard` ada)
+- kebijakan: segmen lebih tua dari `raw_days` diganti rollup (rata-rata per device per `rollup_freq`)
+- index.json mencatat rentang waktu tiap segmen, sehingga query rentang
+  waktu hanya membuka arsip yang relevan
+
+Di dashboard rotasi dijalankan RetentionMaintainer (thread sendiri), bukan
+di thread pesan MQTT. Kebijakan rollup menghapus data raw, jadi di dashboard
+hanya aktif jika secret RETENTION_RAW_DAYS diisi.
+
+    python retention.py --rotate --apply-policy
+    python retention.py --query "2026-01-10 00:00" "2026-01-11 00:00"
+"""
+import argparse
+import io
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+try:
+    import zstandard  # noqa: F401
+    DEFAULT_COMPRESSION = "zstd"
+except ImportError:
+    DEFAULT_COMPRESSION = "gzip"
+
+CSV_COLUMNS = ["ts", "device", "temp", "hum", "gas", "ai", "heartrate"]
+NUMERIC_COLUMNS = ["temp", "hum", "gas", "heartrate"]
+SEVERITY = ["GOOD", "ALERT", "DANGER"]
+EXTENSIONS = {"gzip": ".csv.gz", "zstd": ".csv.zst"}
+SEGMENT_TS_FMT = "%Y%m%d%H%M%S"
+
+
+def severity_codes(series):
+    """Label AI -> indeks SEVERITY: GOOD/ALERT/DANGER (huruf besar/kecil) atau kelas 0/1/2; lainnya NaN."""
+    s = series.astype(str).str.strip().str.upper().str.replace(r"\.0$", "", regex=True)
+    mapping = {label: i for i, label in enumerate(SEVERITY)}
+    mapping.update({str(i): i for i in range(len(SEVERITY))})
+    return s.map(mapping)
+
+
+def _parse_ts(series):
+    # data.csv berisi campuran "%Y-%m-%d %H:%M" dan "%Y-%m-%d %H:%M:%S"
+    return pd.to_datetime(series, errors="coerce", format="mixed")
+
+
+class SensorLogRetention:
+    def __init__(self, csv_path="data.csv", archive_dir="archive", max_bytes=5 * 1024 * 1024,
+                 rotate_daily=True, raw_days=30, rollup_freq="1h", compression=DEFAULT_COMPRESSION):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"compression must be one of {list(EXTENSIONS)}")
+        self.csv_path = csv_path
+        self.archive_dir = archive_dir
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.raw_days = raw_days
+        self.rollup_freq = rollup_freq
+        self.compression = compression
+        self.index_path = os.path.join(archive_dir, "index.json")
+        self.lock = threading.Lock()
+        self._active_day = None
+
+    # ---------------- INDEX ----------------
+    def load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _save_index(self, index):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        index = sorted(index, key=lambda s: s["start"])
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def _write_segment(self, df, kind, ts=None):
+        """
+        `ts`: hasil parse jika df["ts"] masih string asli. String asli ditulis
+        apa adanya sehingga baris segmen identik dengan baris data.csv
+        (train.FeatureCache mengenali sumber dari baris pertamanya).
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        ts = df["ts"] if ts is None else ts
+        start, end = ts.min(), ts.max()
+        base = f"{kind}-{start:{SEGMENT_TS_FMT}}-{end:{SEGMENT_TS_FMT}}"
+        name = base + EXTENSIONS[self.compression]
+        n = 1
+        while os.path.exists(os.path.join(self.archive_dir, name)):
+            name = f"{base}-{n}{EXTENSIONS[self.compression]}"
+            n += 1
+        path = os.path.join(self.archive_dir, name)
+        out = df
+        if pd.api.types.is_datetime64_any_dtype(df["ts"]):
+            out = df.copy()
+            out["ts"] = out["ts"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        out.to_csv(path, index=False, compression=self.compression)
+        return {"file": name, "kind": kind, "start": start.isoformat(sep=" "),
+                "end": end.isoformat(sep=" "), "rows": int(len(df))}
+
+    # ---------------- ROTATION ----------------
+    def _read_active(self):
+        df = pd.read_csv(self.csv_path)
+        df["ts"] = _parse_ts(df["ts"])
+        return df
+
+    def _first_day(self):
+        if self._active_day is None:
+            try:
+                head = pd.read_csv(self.csv_path, nrows=1)
+                ts = _parse_ts(head["ts"])
+                self._active_day = ts.iloc[0].date() if not head.empty and pd.notna(ts.iloc[0]) else None
+            except Exception:
+                return None
+        return self._active_day
+
+    def should_rotate(self, now=None):
+        now = now or datetime.now()
+        try:
+            if os.path.getsize(self.csv_path) >= self.max_bytes:
+                return True
+        except OSError:
+            return False
+        if self.rotate_daily:
+            day = self._first_day()
+            return day is not None and day < now.date()
+        return False
+
+    def rotate(self, writer_lock=None):
+        """
+        Pindahkan isi file aktif ke segmen terkompres dan mulai file aktif baru.
+        Baca & kompres berjalan tanpa `writer_lock`; lock writer hanya ditahan
+        saat baris yang ditambahkan selama kompres disalin ke file aktif baru.
+        """
+        with self.lock:
+            with open(self.csv_path, "rb") as f:
+                data = f.read()
+            # hanya baris lengkap; baris yang sedang ditulis ikut file aktif baru
+            cut = data.rfind(b"\n") + 1
+            # semua kolom sebagai string: isi baris tidak diformat ulang saat diarsipkan
+            df = (pd.read_csv(io.BytesIO(data[:cut]), dtype=str, keep_default_na=False) if cut
+                  else pd.DataFrame(columns=CSV_COLUMNS))
+            ts = _parse_ts(df["ts"])
+            self._active_day = None
+            if ts.notna().sum() == 0:
+                return None
+
+            entry = self._write_segment(df, "raw", ts)
+            index = self.load_index()
+            index.append(entry)
+            self._save_index(index)
+
+            tmp = self.csv_path + ".tmp"
+            with writer_lock or nullcontext():
+                with open(self.csv_path, "rb") as f:
+                    header = f.readline()
+                    f.seek(cut)
+                    tail = f.read()
+                with open(tmp, "wb") as f:
+                    f.write(header + tail)
+                os.replace(tmp, self.csv_path)
+            print(f"[RETENTION] Rotated {entry['rows']} rows -> {entry['file']}")
+            return entry
+
+    def maybe_rotate(self, now=None, writer_lock=None):
+        if self.should_rotate(now):
+            return self.rotate(writer_lock)
+        return None
+
+    # ---------------- POLICY ----------------
+    def rollup(self, df):
+        """Rata-rata per device per rollup_freq; label AI diambil yang paling parah."""
+        df = df.copy()
+        for col in NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        df["severity"] = severity_codes(df["ai"])
+
+        grouped = df.set_index("ts").groupby("device").resample(self.rollup_freq)
+        out = grouped[NUMERIC_COLUMNS].mean()
+        out["severity"] = grouped["severity"].max()
+        out["n"] = grouped["temp"].size()
+        out = out[out["n"] > 0].reset_index()
+        out["ai"] = out["severity"].map(dict(enumerate(SEVERITY)))
+        return out[CSV_COLUMNS + ["n"]]
+
+    def apply_policy(self, now=None):
+        """Segmen raw yang lebih tua dari raw_days hanya disimpan sebagai rollup."""
+        now = now or datetime.now()
+        cutoff = now - timedelta(days=self.raw_days)
+        with self.lock:
+            index = self.load_index()
+            kept = []
+            for entry in index:
+                if entry["kind"] != "raw" or pd.Timestamp(entry["end"]) >= cutoff:
+                    kept.append(entry)
+                    continue
+                path = os.path.join(self.archive_dir, entry["file"])
+                # segmen raw dihapus setelah rollup; catat dulu apa yang akan hilang
+                print(f"[RETENTION] Rolling up {entry['file']} ({entry.get('rows', '?')} raw rows, "
+                      f"end {entry['end']} < cutoff {cutoff:%Y-%m-%d %H:%M}); raw segment will be deleted")
+                df = pd.read_csv(path, dtype={"ts": str, "device": str, "ai": str})
+                df["ts"] = _parse_ts(df["ts"])
+                kept.append(self._write_segment(self.rollup(df.dropna(subset=["ts"])), "rollup"))
+                os.remove(path)
+                print(f"[RETENTION] Rolled up {entry['file']}")
+            if kept != index:
+                self._save_index(kept)
+            return kept
+
+    # ---------------- QUERY ----------------
+    def segments_for(self, start=None, end=None, kinds=("raw", "rollup")):
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        out = []
+        for entry in self.load_index():
+            if entry["kind"] not in kinds:
+                continue
+            if start is not None and pd.Timestamp(entry["end"]) < start:
+                continue
+            if end is not None and pd.Timestamp(entry["start"]) > end:
+                continue
+            out.append(entry)
+        return out
+
+    def query(self, start=None, end=None, devices=None, kinds=("raw", "rollup"), include_active=True):
+        """Baca rentang waktu dari arsip yang beririsan (plus file aktif)."""
+        paths = [os.path.join(self.archive_dir, e["file"]) for e in self.segments_for(start, end, kinds)]
+        if include_active and os.path.exists(self.csv_path):
+            paths.append(self.csv_path)
+
+        frames = []
+        for path in paths:
+            df = pd.read_csv(path)
+            df["ts"] = _parse_ts(df["ts"])
+            if start is not None:
+                df = df[df["ts"] >= pd.Timestamp(start)]
+            if end is not None:
+                df = df[df["ts"] <= pd.Timestamp(end)]
+            if devices is not None:
+                df = df[df["device"].isin(devices)]
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=CSV_COLUMNS)
+        return pd.concat(frames, ignore_index=True).sort_values("ts", kind="stable")
+
+
+class RetentionMaintainer:
+    """
+    Thread pemeliharaan: cek rotasi tiap `interval` detik sehingga ingest MQTT
+    tidak pernah menunggu kompresi. apply_policy (menghapus segmen raw lama
+    setelah di-rollup) hanya dijalankan jika `policy=True`, tiap
+    `policy_interval` detik dan pertama kali setelah satu interval, bukan saat start.
+    """
+
+    def __init__(self, retention, writer_lock=None, interval=30.0, policy=False, policy_interval=24 * 3600):
+        self.retention = retention
+        self.writer_lock = writer_lock
+        self.interval = interval
+        self.policy = policy
+        self.policy_interval = policy_interval
+        self._stop = threading.Event()
+        self._policy_at = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run_loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self, now=None):
+        try:
+            if os.path.exists(self.retention.csv_path):
+                self.retention.maybe_rotate(now, self.writer_lock)
+        except Exception as e:
+            print("[RETENTION] Rotate error:", e)
+
+        if not self.policy:
+            return
+        if self._policy_at is None or time.monotonic() - self._policy_at >= self.policy_interval:
+            self._policy_at = time.monotonic()
+            try:
+                self.retention.apply_policy(now)
+            except Exception as e:
+                print("[RETENTION] Policy error:", e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retensi log sensor")
+    parser.add_argument("--csv", default="data.csv")
+    parser.add_argument("--archive", default="archive")
+    parser.add_argument("--raw-days", type=int, default=30)
+    parser.add_argument("--rollup-freq", default="1h")
+    parser.add_argument("--compression", default=DEFAULT_COMPRESSION, choices=list(EXTENSIONS))
+    parser.add_argument("--rotate", action="store_true", help="rotasi file aktif sekarang")
+    parser.add_argument("--apply-policy", action="store_true", help="ubah segmen lama menjadi rollup")
+    parser.add_argument("--query", nargs=2, metavar=("START", "END"))
+    args = parser.parse_args()
+
+    retention = SensorLogRetention(args.csv, args.archive, raw_days=args.raw_days,
+                                   rollup_freq=args.rollup_freq, compression=args.compression)
+    if args.rotate:
+        retention.rotate()
+    if args.apply_policy:
+        retention.apply_policy()
+    if args.query:
+        result = retention.query(*args.query)
+        print(result.to_string(index=False, max_rows=50))
+    if not (args.rotate or args.apply_policy or args.query):
+        for entry in retention.load_index():
+            print(entry)
@@ -0,0 +1,134 @@
+import heapq
+from datetime import datetime, date, time, timedelta
+
+DATETIME_FMT = "%Y-%m-%d %H:%M"
+TIME_FMT = "%H:%M"
+
+
+# ---------------- RULE ----------------
+def make_rule(medicine, start_date, end_date, times):
+    """
+    Jadwal obat disimpan sebagai rule ringkas, bukan satu string per dosis:
+    {'medicine', 'start', 'end', 'times', 'frequency'}
+    Ukuran rule konstan berapapun lama pengobatan.
+    """
+    if start_date > end_date:
+        raise ValueError("start_date must be <= end_date")
+
+    hhmm = []
+    for t in times:
+        hhmm.append(t.strftime(TIME_FMT) if isinstance(t, time) else str(t))
+    hhmm = sorted(dict.fromkeys(hhmm))
+    if not hhmm:
+        raise ValueError("times must not be empty")
+
+    return {
+        "medicine": medicine.strip(),
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "times": hhmm,
+        "frequency": len(hhmm),
+    }
+
+
+def rule_key(rule):
+    return (rule["medicine"], rule["start"], rule["end"], tuple(rule["times"]))
+
+
+def _rule_dates(rule):
+    return date.fromisoformat(rule["start"]), date.fromisoformat(rule["end"])
+
+
+def _rule_times(rule):
+    return [datetime.strptime(t, TIME_FMT).time() for t in rule["times"]]
+
+
+def count_doses(rule):
+    """Jumlah dosis tanpa ekspansi: hari x jam."""
+    start, end = _rule_dates(rule)
+    return ((end - start).days + 1) * len(rule["times"])
+
+
+def count_unique_doses(rules):
+    """
+    Jumlah dosis unik (datetime, medicine) tanpa ekspansi per dosis. Rentang
+    tanggal tiap obat dipotong di batas start/end rule-nya; dalam satu potongan
+    rule yang aktif tetap, jadi dosisnya = hari x gabungan jam rule tersebut.
+    Rule yang tumpang tindih untuk obat yang sama tidak dihitung dua kali.
+    """
+    spans_by_medicine = {}
+    for rule in rules:
+        start, end = _rule_dates(rule)
+        spans_by_medicine.setdefault(rule["medicine"], []).append((start, end, set(rule["times"])))
+
+    total = 0
+    for spans in spans_by_medicine.values():
+        bounds = sorted({start for start, _, _ in spans} | {end + timedelta(days=1) for _, end, _ in spans})
+        for lo, hi in zip(bounds, bounds[1:]):
+            times = set()
+            for start, end, rule_times in spans:
+                if start <= lo <= end:
+                    times |= rule_times
+            total += (hi - lo).days * len(times)
+    return total
+
+
+def next_dose(rule, after):
+    """Dosis pertama setelah `after`, atau None jika rule sudah selesai."""
+    start, end = _rule_dates(rule)
+    current = max(start, after.date())
+    times = _rule_times(rule)
+    while current <= end:
+        for t in times:
+            dt = datetime.combine(current, t)
+            if dt > after:
+                return dt
+        current += timedelta(days=1)
+    return None
+
+
+# ---------------- LAZY EXPANSION ----------------
+def expand_rule(rule, window_start=None, window_end=None):
+    """
+    Generator datetime dosis dalam [window_start, window_end].
+    Hanya hari yang beririsan dengan window yang dikunjungi.
+    """
+    start, end = _rule_dates(rule)
+    if window_start is not None:
+        start = max(start, window_start.date())
+    if window_end is not None:
+        end = min(end, window_end.date())
+
+    times = _rule_times(rule)
+    current = start
+    while current <= end:
+        for t in times:
+            dt = datetime.combine(current, t)
+            if window_start is not None and dt < window_start:
+                continue
+            if window_end is not None and dt > window_end:
+                continue
+            yield dt
+        current += timedelta(days=1)
+
+
+def _tagged(rule, window_start, window_end):
+    for dt in expand_rule(rule, window_start, window_end):
+        yield dt, rule["medicine"]
+
+
+def expand_rules(rules, window_start=None, window_end=None):
+    """
+    Gabungkan ekspansi semua rule (terurut waktu) menjadi list
+    {'datetime', 'medicine'} untuk tampilan. Duplikat (datetime, medicine) dibuang.
+    """
+    streams = [_tagged(rule, window_start, window_end) for rule in rules]
+    rows = []
+    seen = set()
+    for dt, medicine in heapq.merge(*streams):
+        key = (dt, medicine)
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append({"datetime": dt.strftime(DATETIME_FMT), "medicine": medicine})
+    return rows
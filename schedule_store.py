@@ -0,0 +1,192 @@
+import heapq
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from schedule import rule_key, next_dose, count_unique_doses, DATETIME_FMT
+
+
+class ScheduleStore:
+    """
+    Penyimpanan rule jadwal obat di SQLite (persisten, tahan reload).
+    Dedupe per (datetime, medicine): rule hanya disimpan jika menambah dosis
+    yang belum dicakup rule lain untuk obat yang sama.
+    """
+
+    def __init__(self, path="schedules.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS medicine_rules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    medicine TEXT NOT NULL,
+                    start TEXT NOT NULL,
+                    end TEXT NOT NULL,
+                    times TEXT NOT NULL,
+                    frequency INTEGER NOT NULL,
+                    UNIQUE (medicine, start, end, times)
+                )
+            """)
+            # rule aktif dicari lewat tanggal selesai
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_rules_end ON medicine_rules (end, medicine)")
+            # rule obat yang sama yang beririsan, untuk dedupe saat add
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_rules_medicine ON medicine_rules (medicine, start)")
+
+    @staticmethod
+    def _row_to_rule(row):
+        _, medicine, start, end, times, frequency = row
+        return {"medicine": medicine, "start": start, "end": end,
+                "times": json.loads(times), "frequency": frequency}
+
+    def add(self, rule):
+        """
+        Return (id rule baru, jumlah dosis baru). id None jika semua dosis
+        rule sudah ada (rule identik atau dicakup rule lain obat yang sama).
+        """
+        medicine, start, end, times = rule_key(rule)
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT * FROM medicine_rules WHERE medicine = ? AND start <= ? AND end >= ?", (medicine, end, start)
+            ).fetchall()
+            overlapping = [self._row_to_rule(row) for row in rows]
+            new_doses = count_unique_doses(overlapping + [rule]) - count_unique_doses(overlapping)
+            if new_doses == 0:
+                return None, 0
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO medicine_rules (medicine, start, end, times, frequency) VALUES (?, ?, ?, ?, ?)",
+                (medicine, start, end, json.dumps(list(times)), rule["frequency"]),
+            )
+            return (cur.lastrowid, new_doses) if cur.rowcount else (None, 0)
+
+    def all(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM medicine_rules ORDER BY medicine, start").fetchall()
+        return [(row[0], self._row_to_rule(row)) for row in rows]
+
+    def active(self, now=None):
+        """Rule yang belum selesai pada `now` (memakai index end)."""
+        now = now or datetime.now()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM medicine_rules WHERE end >= ?", (now.date().isoformat(),)
+            ).fetchall()
+        return [(row[0], self._row_to_rule(row)) for row in rows]
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM medicine_rules")
+
+
+class ScheduleDispatcher:
+    """
+    Timer min-heap: satu entri (due, medicine, rule_id) per rule aktif.
+    Thread menunggu sampai dosis terdekat jatuh tempo, publish, lalu
+    push dosis berikutnya dari rule yang sama. Biaya O(log n) per dosis.
+    """
+
+    def __init__(self, store, publish, clock=datetime.now):
+        self.store = store
+        self.publish = publish
+        self.clock = clock
+        self.heap = []
+        self.rules = {}
+        self.cond = threading.Condition()
+        self._stopped = False
+        self.thread = None
+
+    def _push(self, rule_id, rule, after):
+        due = next_dose(rule, after)
+        if due is not None:
+            heapq.heappush(self.heap, (due, rule["medicine"], rule_id))
+
+    def load(self):
+        now = self.clock()
+        with self.cond:
+            self.heap = []
+            self.rules = dict(self.store.active(now))
+            for rule_id, rule in self.rules.items():
+                self._push(rule_id, rule, now)
+            self.cond.notify()
+
+    def add(self, rule_id, rule):
+        with self.cond:
+            self.rules[rule_id] = rule
+            self._push(rule_id, rule, self.clock())
+            self.cond.notify()
+
+    def clear(self):
+        with self.cond:
+            self.heap = []
+            self.rules = {}
+            self.cond.notify()
+
+    def upcoming(self, limit=10):
+        """
+        Dosis berikutnya terurut (datetime, medicine). Salinan heap dimajukan
+        seperti thread dispatcher, jadi satu rule bisa muncul beberapa kali.
+        """
+        with self.cond:
+            heap = list(self.heap)
+            rules = dict(self.rules)
+        rows = []
+        while heap and len(rows) < limit:
+            due, medicine, rule_id = heapq.heappop(heap)
+            rule = rules.get(rule_id)
+            if rule is None:
+                continue
+            if not rows or rows[-1] != (due, medicine):
+                rows.append((due, medicine))
+            after = next_dose(rule, due)
+            if after is not None:
+                heapq.heappush(heap, (after, medicine, rule_id))
+        return [{"datetime": due.strftime(DATETIME_FMT), "medicine": medicine} for due, medicine in rows]
+
+    def start(self):
+        self.load()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self._stopped = True
+            self.cond.notify()
+
+    def _pop_due(self):
+        """Ambil semua dosis yang sudah jatuh tempo; (datetime, medicine) kembar digabung."""
+        due_items = []
+        now = self.clock()
+        while self.heap and self.heap[0][0] <= now:
+            due, medicine, rule_id = heapq.heappop(self.heap)
+            rule = self.rules.get(rule_id)
+            if rule is None:
+                continue  # rule sudah dihapus
+            if not due_items or due_items[-1] != (due, medicine):
+                due_items.append((due, medicine))
+            self._push(rule_id, rule, due)
+        return due_items
+
+    def _run_loop(self):
+        while True:
+            with self.cond:
+                if self._stopped:
+                    return
+                due_items = self._pop_due()
+                if not due_items:
+                    if self.heap:
+                        delay = (self.heap[0][0] - self.clock()).total_seconds()
+                        # dibatasi agar perubahan jam sistem tetap terdeteksi
+                        self.cond.wait(timeout=min(max(delay, 0), 60))
+                    else:
+                        self.cond.wait()
+                    continue
+
+            for due, medicine in due_items:
+                try:
+                    self.publish(medicine, due.strftime(DATETIME_FMT))
+                except Exception as e:
+                    print("[OBAT] Publish reminder error:", e)
@@ -0,0 +1,257 @@
+"""
+Snapshot & restore state fitur per device untuk warm restart.
+
+State yang disimpan: ModelService.history (deque roll_size), last,
+last[device + "_avg"] (dasar trend) dan MQTTRunner.last_timestamp (dedupe).
+Tanpa state ini delta/rolling/trend setiap device mulai dari nol setelah
+restart dan label pertama cenderung GOOD palsu.
+
+Format: satu file .npz tanpa kompresi dan tanpa pickle:
+    version, roll_size   skalar
+    devices, ts_devices  nama device (JSON utf-8, uint8)
+    ts                   last_timestamp per ts_devices (JSON utf-8, uint8)
+    hist                 float64 (n, 3, roll_size) temp/hum/gas, diisi dari kiri
+    hist_len             int8 (n,) jumlah nilai di deque
+    last                 float64 (n, 3) nilai terakhir temp/hum/gas
+    avg                  float64 (n, 2) rolling temp/gas terakhir
+
+Restore: muat snapshot (jika ada dan roll_size cocok), lalu replay tail
+history (segmen raw terakhir + data.csv) untuk baris yang lebih baru dari
+snapshot. Tanpa snapshot, replay tail itu sendiri menjadi fallback.
+
+    python state_snapshot.py --inspect cache/device_state.npz
+"""
+import argparse
+import gc
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PATH = os.path.join("cache", "device_state.npz")
+
+
+def _encode_names(names):
+    return np.frombuffer(json.dumps(names).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_names(arr):
+    return json.loads(arr.tobytes().decode("utf-8"))
+
+
+# ---------------- SNAPSHOT ----------------
+def capture(model, last_timestamp, lock=None, batch=10_000):
+    """
+    Salin state per device. Dengan lock (MQTTRunner.state_lock) penyalinan
+    dilakukan per batch device agar ingest hanya tertahan sebentar; tiap
+    device tetap konsisten dengan last_timestamp-nya sendiri.
+    """
+    lock = lock or nullcontext()
+    with lock:
+        devices = list(model.history)
+    history, last = model.history, model.last
+    rows, stamps = [], {}
+    for i in range(0, len(devices), batch):
+        with lock:
+            for device in devices[i:i + batch]:
+                h = history[device]
+                rows.append((device, tuple(h["temp"]), tuple(h["hum"]), tuple(h["gas"]),
+                             last.get(device), last.get(device + "_avg")))
+                if device in last_timestamp:
+                    stamps[device] = last_timestamp[device]
+    return rows, stamps
+
+
+def encode(rows, last_timestamp, roll_size):
+    n = len(rows)
+    hist = np.zeros((n, 3, roll_size))
+    hist_len = np.zeros(n, dtype=np.int8)
+    last = np.zeros((n, 3))
+    avg = np.zeros((n, 2))
+    for i, (_, t, h, g, lv, av) in enumerate(rows):
+        k = len(t)
+        hist[i, 0, :k], hist[i, 1, :k], hist[i, 2, :k] = t, h, g
+        hist_len[i] = k
+        if lv is not None:
+            last[i] = (lv["temp"], lv["hum"], lv["gas"])
+        if av is not None:
+            avg[i] = (av["temp"], av["gas"])
+    return {
+        "version": np.int64(SNAPSHOT_VERSION),
+        "roll_size": np.int64(roll_size),
+        "devices": _encode_names([r[0] for r in rows]),
+        "ts_devices": _encode_names(list(last_timestamp)),
+        "ts": _encode_names(list(last_timestamp.values())),
+        "hist": hist, "hist_len": hist_len, "last": last, "avg": avg,
+    }
+
+
+def save_snapshot(path, model, last_timestamp, lock=None):
+    """Tulis snapshot secara atomik. Return jumlah device."""
+    rows, stamps = capture(model, last_timestamp, lock)
+    arrays = encode(rows, stamps, model.roll_size)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+    return len(rows)
+
+
+def load_snapshot(path, model, last_timestamp):
+    """Isi model.history/last dan last_timestamp dari snapshot. Return jumlah device."""
+    with np.load(path, allow_pickle=False) as data:
+        if int(data["version"]) != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {int(data['version'])}")
+        if int(data["roll_size"]) != model.roll_size:
+            raise ValueError(f"snapshot roll_size {int(data['roll_size'])} != {model.roll_size}")
+        devices = _decode_names(data["devices"])
+        hist = data["hist"]
+        temps, hums, gases = (hist[:, j, :].tolist() for j in range(3))
+        hist_len = data["hist_len"].tolist()
+        last, avg = data["last"].tolist(), data["avg"].tolist()
+        stamps = dict(zip(_decode_names(data["ts_devices"]), _decode_names(data["ts"])))
+
+    roll_size = model.roll_size
+    history, model_last = model.history, model.last
+    # ratusan ribu dict/deque baru memicu GC generasional berulang (~2x lebih lambat)
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for device, t, h, g, k, lv, av in zip(devices, temps, hums, gases, hist_len, last, avg):
+            if k != roll_size:
+                t, h, g = t[:k], h[:k], g[:k]
+            history[device] = {"temp": deque(t, roll_size), "hum": deque(h, roll_size), "gas": deque(g, roll_size)}
+            model_last[device] = {"temp": lv[0], "hum": lv[1], "gas": lv[2]}
+            model_last[device + "_avg"] = {"temp": av[0], "gas": av[1]}
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    last_timestamp.update(stamps)
+    return len(devices)
+
+
+# ---------------- FALLBACK / CATCH-UP ----------------
+def tail_sources(csv_path="data.csv", archive_dir=None, segments=1):
+    """`segments` segmen raw terakhir + file aktif."""
+    paths = []
+    if archive_dir:
+        from retention import SensorLogRetention
+        entries = SensorLogRetention(csv_path, archive_dir).segments_for(kinds=("raw",))
+        paths = [os.path.join(archive_dir, e["file"]) for e in entries[-segments:]] if segments else []
+    if os.path.exists(csv_path):
+        paths.append(csv_path)
+    return paths
+
+
+def replay_tail(model, last_timestamp, paths):
+    """
+    Replay baris history yang lebih baru dari last_timestamp, cukup roll_size
+    baris terakhir per device: deque, last dan avg hasilnya sama persis
+    dengan jalur streaming. Return jumlah baris yang di-replay.
+    """
+    import pandas as pd
+    from rescore import _load_chunk
+
+    frames = [pd.read_csv(p, dtype={"ts": str, "device": str}) for p in paths]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return 0
+    df = _load_chunk(pd.concat(frames, ignore_index=True))
+
+    # dedupe seperti MQTTRunner, mulai dari last_timestamp yang sudah ada
+    known = df["device"].map(last_timestamp).fillna("")
+    codes = pd.factorize(pd.concat([df["ts"], known], ignore_index=True), sort=True)[0]
+    ts_code = pd.Series(codes[:len(df)], index=df.index)
+    known_code = np.where(known.to_numpy() != "", codes[len(df):], -1)
+    prev_max = (ts_code.groupby(df["device"], sort=False).cummax()
+                .groupby(df["device"], sort=False).shift().fillna(-1).to_numpy())
+    accepted = df[ts_code.to_numpy() > np.maximum(prev_max, known_code)]
+
+    tail = accepted.groupby("device", sort=False).tail(model.roll_size)
+    for row in tail.itertuples(index=False):
+        model.compute_features(row.device, row.temp, row.hum, row.gas, row.ts)
+        last_timestamp[row.device] = row.ts
+    return len(tail)
+
+
+def restore_state(model, last_timestamp, path=SNAPSHOT_PATH, csv_path="data.csv", archive_dir=None):
+    t0 = time.perf_counter()
+    restored = 0
+    if path and os.path.exists(path):
+        try:
+            restored = load_snapshot(path, model, last_timestamp)
+        except Exception as e:
+            print("[STATE] Snapshot unusable, rebuilding from history:", e)
+            model.history.clear()
+            model.last.clear()
+            last_timestamp.clear()
+    replayed = replay_tail(model, last_timestamp, tail_sources(csv_path, archive_dir))
+    print(f"[STATE] Restored {restored} devices from snapshot, replayed {replayed} rows "
+          f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return {"snapshot_devices": restored, "replayed_rows": replayed, "devices": len(model.history)}
+
+
+class StateSnapshotter:
+    """
+    Simpan snapshot state runner tiap `interval` detik (dan saat stop).
+    Snapshot saat stop tidak mencetak log: stop() dipanggil dari atexit,
+    ketika stdout proses bisa sudah dibaca/ditutup pemanggilnya.
+    """
+
+    def __init__(self, runner, path=SNAPSHOT_PATH, interval=60.0):
+        self.runner = runner
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._saved_version = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.snapshot()
+
+    def _run_loop(self):
+        while not self._stop.wait(self.interval):
+            self.snapshot(verbose=True)
+
+    def snapshot(self, verbose=False):
+        runner = self.runner
+        model = runner.model
+        version = runner.get_data_version()
+        if model is None or version == self._saved_version:
+            return None
+        try:
+            t0 = time.perf_counter()
+            n = save_snapshot(self.path, model, runner.last_timestamp, runner.state_lock)
+        except Exception as e:
+            if verbose:
+                print("[STATE] Snapshot failed:", e)
+            return None
+        self._saved_version = version
+        if verbose:
+            print(f"[STATE] Snapshot {n} devices in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot state per device")
+    parser.add_argument("--inspect", default=SNAPSHOT_PATH, help="tampilkan isi snapshot")
+    args = parser.parse_args()
+
+    with np.load(args.inspect, allow_pickle=False) as data:
+        devices = _decode_names(data["devices"])
+        print({"version": int(data["version"]), "roll_size": int(data["roll_size"]), "devices": len(devices),
+               "last_timestamp": len(_decode_names(data["ts_devices"])), "bytes": os.path.getsize(args.inspect)})
+        for i, device in enumerate(devices[:10]):
+            print(device, data["hist"][i].tolist(), data["last"][i].tolist(), data["avg"][i].tolist())
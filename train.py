@@ -0,0 +1,263 @@
+"""
+Pipeline retraining dari history sensor tersimpan.
+
+1. features: bangun matriks 12 fitur (sama dengan compute_features) dari
+   segmen raw di archive/ + data.csv, disimpan sebagai chunk .npy di
+   cache/features. Run berikutnya hanya memproses baris baru; sumber
+   dikenali dari fingerprint baris pertamanya, sehingga data.csv yang
+   dirotasi menjadi segmen tetap dianggap sudah diproses. Jika label baris
+   yang sudah di-cache berubah (mis. rescore.py --in-place), cache dibangun ulang.
+2. scaler: StandardScaler (fit dengan nama fitur, seperti di ModelService)
+3. model: RandomForestClassifier dengan n_jobs
+4. save: pkl {'model', 'scaler', 'features': FEATURE_NAMES} ditulis atomik (aman untuk ModelReloader)
+
+Waktu, puncak alokasi (tracemalloc) dan max RSS dilaporkan per tahap.
+
+    python train.py --output models/smarthealth_retrained.pkl
+    python train.py --rebuild --n-jobs 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import time
+import tracemalloc
+import zlib
+from contextlib import contextmanager
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from model import FEATURE_NAMES
+from rescore import build_features, archive_sources, _load_chunk
+from retention import severity_codes
+
+MODEL_PATH = "models/smarthealth_retrained.pkl"
+CACHE_DIR = os.path.join("cache", "features")
+LABELS = {"GOOD": 0, "ALERT": 1, "DANGER": 2}
+MANIFEST_VERSION = 2
+
+STAGES = []
+
+
+def encode_labels(series):
+    """GOOD/ALERT/DANGER (huruf besar/kecil) atau kelas 0/1/2 -> int; lainnya -1."""
+    return severity_codes(series).fillna(-1).to_numpy(dtype=np.int8)
+
+
+@contextmanager
+def stage(name):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        row = {
+            "stage": name,
+            "seconds": round(time.perf_counter() - t0, 3),
+            "peak_alloc_mb": round(peak / 2**20, 1),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+        STAGES.append(row)
+        print(f"[TRAIN] {row}")
+
+
+# ---------------- FEATURE CACHE ----------------
+class FeatureCache:
+    def __init__(self, cache_dir=CACHE_DIR, roll_size=3):
+        self.cache_dir = cache_dir
+        self.roll_size = roll_size
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.carry_path = os.path.join(cache_dir, "carry.csv")
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("roll_size") == self.roll_size and manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return self._empty_manifest()
+
+    def _empty_manifest(self):
+        return {"version": MANIFEST_VERSION, "roll_size": self.roll_size, "sources": {}, "chunks": []}
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                os.remove(os.path.join(self.cache_dir, name))
+        self.manifest = self._empty_manifest()
+
+    @staticmethod
+    def fingerprint(path):
+        """
+        Hash string ts/device/temp/hum/gas baris data pertama. Rotasi menyalin
+        baris data.csv ke segmen tanpa memformat ulang, jadi segmen hasil rotasi
+        memakai fingerprint (dan progres di manifest) yang sama dan tidak dibaca ulang.
+        """
+        head = pd.read_csv(path, nrows=1, dtype=str)
+        if head.empty:
+            return None
+        first = head.iloc[0].fillna("")
+        return hashlib.sha1("|".join(first[c] for c in ("ts", "device", "temp", "hum", "gas")).encode()).hexdigest()
+
+    @staticmethod
+    def label_crc(labels, crc=0):
+        """CRC32 berantai atas teks label ai (satu per baris); sama walau dipotong per chunk."""
+        return zlib.crc32("".join(f"{v}\n" for v in labels).encode(), crc)
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return [path, st.st_size, st.st_mtime_ns]
+
+    def _labels_unchanged(self, path, entry, chunksize):
+        # jalur cepat: file yang sama dan belum disentuh sejak extend terakhir
+        if entry["stat"] == self._stat(path):
+            return True
+        crc = 0
+        reader = pd.read_csv(path, usecols=["ai"], dtype=str, keep_default_na=False,
+                             nrows=entry["rows"], chunksize=chunksize)
+        for chunk in reader:
+            crc = self.label_crc(chunk["ai"], crc)
+        return crc == entry["labels"]
+
+    def _load_carry(self):
+        if not os.path.exists(self.carry_path):
+            return None
+        return _load_chunk(pd.read_csv(self.carry_path, dtype={"ts": str, "device": str}))
+
+    def extend(self, sources, chunksize=100_000):
+        """Tambahkan fitur untuk baris yang belum ada di cache. Return jumlah baris baru."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        sources = list(sources)
+        for path in sources:
+            entry = self.manifest["sources"].get(self.fingerprint(path) or "")
+            if entry is not None and not self._labels_unchanged(path, entry, chunksize):
+                # label baris lama berubah (rescore): y di cache basi, bangun ulang
+                print(f"[TRAIN] Labels in {path} changed since cached; rebuilding feature cache")
+                self.clear()
+                os.makedirs(self.cache_dir, exist_ok=True)
+                break
+
+        carry = self._load_carry()
+        added = 0
+        for path in sources:
+            fp = self.fingerprint(path)
+            if fp is None:
+                continue
+            entry = self.manifest["sources"].setdefault(fp, {"rows": 0, "labels": 0, "stat": None})
+            reader = pd.read_csv(path, chunksize=chunksize, dtype={"ts": str, "device": str, "ai": str},
+                                 keep_default_na=False, skiprows=range(1, entry["rows"] + 1))
+            for chunk in reader:
+                entry["labels"] = self.label_crc(chunk["ai"], entry["labels"])
+                chunk = _load_chunk(chunk)
+                combined = pd.concat([carry, chunk], ignore_index=True) if carry is not None else chunk.reset_index(drop=True)
+                is_new = np.r_[np.zeros(len(combined) - len(chunk), dtype=bool), np.ones(len(chunk), dtype=bool)]
+
+                keep, features = build_features(combined, self.roll_size)
+                kept_new = is_new[keep]
+                labels = encode_labels(combined.loc[keep, "ai"])
+
+                idx = len(self.manifest["chunks"])
+                np.save(os.path.join(self.cache_dir, f"X_{idx:05d}.npy"), features[kept_new].astype(np.float64))
+                np.save(os.path.join(self.cache_dir, f"y_{idx:05d}.npy"), labels[kept_new])
+                self.manifest["chunks"].append({"index": idx, "rows": int(kept_new.sum())})
+
+                carry = combined[keep].groupby("device", sort=False).tail(self.roll_size)
+                carry.to_csv(self.carry_path, index=False)
+                entry["rows"] += len(chunk)
+                entry["stat"] = self._stat(path)
+                self._save_manifest()
+                added += int(kept_new.sum())
+            if entry["stat"] != self._stat(path):
+                entry["stat"] = self._stat(path)
+                self._save_manifest()
+        return added
+
+    def load(self):
+        """Gabungkan chunk (dibuka sebagai memmap) menjadi X, y."""
+        xs, ys = [], []
+        for c in self.manifest["chunks"]:
+            xs.append(np.load(os.path.join(self.cache_dir, f"X_{c['index']:05d}.npy"), mmap_mode="r"))
+            ys.append(np.load(os.path.join(self.cache_dir, f"y_{c['index']:05d}.npy"), mmap_mode="r"))
+        if not xs:
+            return np.empty((0, len(FEATURE_NAMES))), np.empty(0, dtype=np.int8)
+        return np.concatenate(xs), np.concatenate(ys)
+
+
+def history_sources(csv_path="data.csv", archive_dir="archive"):
+    """Segmen raw (urut waktu) lalu file aktif."""
+    paths = archive_sources(csv_path, archive_dir)
+    if os.path.exists(csv_path):
+        paths.append(csv_path)
+    return paths
+
+
+# ---------------- TRAIN ----------------
+def train(csv_path="data.csv", archive_dir="archive", output=MODEL_PATH, cache_dir=CACHE_DIR,
+          roll_size=3, n_estimators=180, n_jobs=-1, rebuild=False, random_state=42):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    STAGES.clear()
+    cache = FeatureCache(cache_dir, roll_size)
+    if rebuild:
+        cache.clear()
+
+    with stage("features"):
+        added = cache.extend(history_sources(csv_path, archive_dir))
+        X, y = cache.load()
+        labelled = y >= 0
+        X, y = X[labelled], y[labelled]
+    print(f"[TRAIN] {added} new rows cached, {len(y)} labelled rows total")
+    if len(np.unique(y)) < 2:
+        raise ValueError("need at least two label classes in history to train")
+
+    # nama kolom sesuai urutan build_features/compute_features (diterima ModelReloader)
+    feature_names = list(FEATURE_NAMES)
+    with stage("scaler"):
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(pd.DataFrame(X, columns=feature_names))
+
+    with stage("model"):
+        # RandomForest dilatih tanpa nama fitur (ModelService memberi numpy)
+        model = RandomForestClassifier(n_estimators=n_estimators, n_jobs=n_jobs, random_state=random_state)
+        model.fit(np.asarray(X_scaled), y)
+
+    with stage("save"):
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        tmp = output + ".tmp"
+        joblib.dump({"model": model, "scaler": scaler, "features": feature_names}, tmp)
+        os.replace(tmp, output)
+
+    return {"rows": int(len(y)), "new_rows": added, "output": output, "stages": list(STAGES)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain model dari history sensor")
+    parser.add_argument("--csv", default="data.csv")
+    parser.add_argument("--archive", default="archive")
+    parser.add_argument("--output", default=MODEL_PATH)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--roll-size", type=int, default=3)
+    parser.add_argument("--n-estimators", type=int, default=180)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--rebuild", action="store_true", help="hapus cache fitur dan bangun ulang")
+    args = parser.parse_args()
+
+    result = train(args.csv, args.archive, args.output, args.cache_dir, args.roll_size,
+                   args.n_estimators, args.n_jobs, args.rebuild)
+    print(json.dumps(result, indent=1))